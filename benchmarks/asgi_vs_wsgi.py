@@ -0,0 +1,149 @@
+"""
+Compares creating food items whose calories must be looked up upstream, through
+calorie_project.wsgi on a pool of worker threads and through calorie_project.asgi
+on a single event loop, each with the whole middleware stack.
+
+Nutritionix is replaced by a local server answering every food after `--latency`
+seconds, and each request posts a different food so that every one of them
+misses the cache. All requests arrive at once and their latency is counted
+from then, queueing included. Each application is loaded in a process of its
+own, as asgi.py turns the async views on. Both run with the SQLite production
+profile: under ASGI every request gets a thread and a connection of its own,
+and the stock settings fail concurrent writers with "database is locked".
+
+    $ python benchmarks/asgi_vs_wsgi.py --requests 200 --threads 8 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.support import setup_database, start_upstream, summarize  # noqa: E402
+
+# Allowed by the DEBUG settings without ALLOWED_HOSTS.
+HOST = 'localhost'
+
+os.environ.setdefault('SQLITE_PRODUCTION', '1')
+
+
+def report(name, elapsed, latencies, statuses):
+    stats = summarize(latencies, elapsed)
+    failed = len([status for status in statuses if status != 201])
+    print(f"{name}: {stats['throughput']:8.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  "
+          f"p95 {stats['p95_ms']:7.1f} ms  failed {failed}")
+
+
+def create_user():
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    from calorie_app.models import UserProfile
+
+    user = User.objects.create(username='benchmark')
+    UserProfile.objects.create(user=user, max_calories=2000)
+    return f'token {Token.objects.create(user=user).key}'
+
+
+def run_wsgi(args):
+    from django.test import RequestFactory
+
+    from calorie_project.wsgi import application
+
+    teardown = setup_database(os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3'))
+    auth = create_user()
+
+    def post(index):
+        environ = RequestFactory().post(
+            '/fooditem/', {"food_item": f"wsgi food {index}"}, HTTP_AUTHORIZATION=auth, HTTP_HOST=HOST
+        ).environ
+        statuses = []
+        response = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+        # Closing the response fires request_finished, which closes the thread's connection.
+        response.close()
+        return time.perf_counter() - started, statuses[0]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(post, range(args.requests)))
+    report(f"wsgi, {args.threads} threads", time.perf_counter() - started, *zip(*results))
+    teardown()
+
+
+def run_asgi(args):
+    from asgiref.sync import sync_to_async
+    from django.db import connections
+
+    from calorie_project.asgi import application
+
+    teardown = setup_database(os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3'))
+    auth = create_user()
+
+    async def post(index):
+        body = urlencode({"food_item": f"asgi food {index}"}).encode('utf-8')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': 'POST', 'path': '/fooditem/', 'raw_path': b'/fooditem/', 'root_path': '',
+            'query_string': b'', 'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+            'headers': [
+                (b'host', HOST.encode('ascii')),
+                (b'authorization', auth.encode('ascii')),
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode('ascii')),
+            ],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected until the handler is done with it.
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await application(scope, receive, send)
+        return time.perf_counter() - started, statuses[0]
+
+    async def run():
+        results = await asyncio.gather(*(post(index) for index in range(args.requests)))
+        await sync_to_async(connections.close_all)()
+        return results
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    report("asgi, 1 event loop", time.perf_counter() - started, *zip(*results))
+    teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8, help="worker threads of the WSGI run")
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds the upstream takes to answer")
+    parser.add_argument('--handler', choices=('wsgi', 'asgi'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.handler is None:
+        print(f"{args.requests} requests, upstream latency {args.latency * 1000:.0f} ms")
+        for handler in ('wsgi', 'asgi'):
+            subprocess.run([sys.executable, __file__, *sys.argv[1:], '--handler', handler], check=True)
+        return
+
+    upstream = start_upstream(args.latency, backlog=args.requests)
+    # Each entry point sets up Django itself, asgi.py turning the async views on first.
+    {'wsgi': run_wsgi, 'asgi': run_asgi}[args.handler](args)
+    upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Load test of the API hot paths: login, creating food items with and without
+calories, filtered food item lists and the user list.
+
+The database is seeded with `--users` normal users and `--items` food items
+spread over the last year (10k users and 10M items by default, which takes a
+while: seed once with --keep and reuse the file afterwards). Requests go
+through the whole middleware stack with the test client, from `--threads`
+threads, and calories are looked up from a local fake Nutritionix answering
+after `--latency` seconds.
+
+Each scenario reports latency percentiles, throughput and the number of
+database queries per request. --save-baseline stores them in
+benchmarks/baselines.json and --check compares a run to it, failing when a
+scenario runs more queries or its p95 grew by more than --tolerance.
+
+    $ python benchmarks/load.py --users 10000 --items 10000000 --database /tmp/load.sqlite3 --keep
+    $ python benchmarks/load.py --users 200 --items 100000 --check
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.support import setup_database, start_upstream, summarize  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+PASSWORD = 'bench-password'
+FOODS = ['Apple', 'Banana', 'Rice', 'Bread', 'Egg', 'Chicken', 'Salad', 'Pasta', 'Yogurt', 'Coffee']
+
+
+def seed(users, items, batch_size=10000):
+    """
+    Creates the admin, `users` normal users with their tokens and `items` food
+    items, unless the database already has them.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import Group, User
+    from django.db import transaction
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+
+    from calorie_app.models import FoodItem, UserProfile
+    from calorie_app.roles import ADMINISTRATOR, NORMAL_USER, USER_MANAGER
+    from calorie_app.rollups import rebuild_daily_totals
+
+    groups = {name: Group.objects.get_or_create(name=name)[0] for name in (ADMINISTRATOR, USER_MANAGER, NORMAL_USER)}
+    if User.objects.filter(username='bench-admin').exists():
+        print("Reusing the seeded database")
+        return
+    started = time.monotonic()
+    password = make_password(PASSWORD)
+    random.seed(19)
+    with transaction.atomic():
+        admin = User.objects.create(username='bench-admin', password=password)
+        admin.groups.add(groups[ADMINISTRATOR])
+        UserProfile.objects.create(user=admin, max_calories=2000)
+        User.objects.bulk_create(
+            (User(username=f'bench-user-{index}', password=password) for index in range(users)),
+            batch_size=batch_size
+        )
+        ids = list(User.objects.filter(username__startswith='bench-user-').values_list('id', flat=True))
+        User.groups.through.objects.bulk_create(
+            (User.groups.through(user_id=user_id, group_id=groups[NORMAL_USER].id) for user_id in ids),
+            batch_size=batch_size
+        )
+        UserProfile.objects.bulk_create(
+            (UserProfile(user_id=user_id, max_calories=random.randint(1500, 3000)) for user_id in ids),
+            batch_size=batch_size
+        )
+        Token.objects.bulk_create(
+            (Token(user_id=user_id, key=os.urandom(20).hex()) for user_id in [admin.id] + ids),
+            batch_size=batch_size
+        )
+    print(f"Seeded {users} users in {time.monotonic() - started:.1f}s")
+
+    now = timezone.now()
+    created = 0
+    while created < items:
+        batch = []
+        for _ in range(min(batch_size, items - created)):
+            timestamp = now - timedelta(seconds=random.randrange(365 * 24 * 3600))
+            batch.append(FoodItem(
+                user_id=random.choice(ids),
+                timestamp=timestamp,
+                local_date=timestamp.date(),
+                food_item=random.choice(FOODS),
+                num_of_calories=random.randint(50, 800),
+            ))
+        FoodItem.objects.bulk_create(batch)
+        created += len(batch)
+        if created % (batch_size * 100) == 0 or created == items:
+            print(f"Seeded {created} food items ({created / (time.monotonic() - started):.0f} items/s)")
+    rebuild_daily_totals()
+    print(f"Seeded the database in {time.monotonic() - started:.1f}s")
+
+
+def scenarios(users):
+    """
+    Functions making one request of each scenario with a test client, given the request number.
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+
+    tokens = dict(Token.objects.filter(user__username__startswith='bench-').values_list('user__username', 'key'))
+    admin = tokens['bench-admin']
+    since = (timezone.now() - timedelta(days=30)).date()
+    run = f'{time.time():.0f}'
+
+    def user(index):
+        return f'bench-user-{index % users}'
+
+    def auth(username):
+        return {'HTTP_AUTHORIZATION': f'token {tokens[username]}'}
+
+    def login(client, index):
+        return client.post('/login/', {'username': user(index), 'password': PASSWORD})
+
+    def create_with_calories(client, index):
+        data = {'food_item': random.choice(FOODS), 'num_of_calories': 250}
+        return client.post('/fooditem/', data, **auth(user(index)))
+
+    def create_lookup(client, index):
+        # A new food on every request, so that every one of them is looked up upstream.
+        data = {'food_item': f'bench food {run} {index}'}
+        return client.post('/fooditem/', data, **auth(user(index)))
+
+    def filtered_list(client, index):
+        return client.get(f'/fooditem/?ge(day,{since})&item={random.choice(FOODS)}', **auth(user(index)))
+
+    def admin_filtered_list(client, index):
+        return client.get(f'/fooditem/?consumer={user(index)}&ge(day,{since})', **auth('bench-admin'))
+
+    def user_list(client, index):
+        return client.get(f'/users/?offset={index % max(1, users - 5)}', HTTP_AUTHORIZATION=f'token {admin}')
+
+    assert User.objects.filter(username=user(0)).exists(), "The database isn't seeded"
+    return {
+        'login': (login, 201),
+        'create_with_calories': (create_with_calories, 201),
+        'create_lookup': (create_lookup, 201),
+        'filtered_list': (filtered_list, 200),
+        'admin_filtered_list': (admin_filtered_list, 200),
+        'user_list': (user_list, 200),
+    }
+
+
+def clear_caches():
+    from django.core.cache import caches
+
+    from calorie_app.authentication import token_cache
+    from calorie_app.nutrition import lookup_cache
+
+    for cache in caches.all():
+        cache.clear()
+    token_cache.clear()
+    lookup_cache.clear()
+
+
+def run_scenario(request, expected, count, threads):
+    """
+    Makes `count` requests from `threads` threads. Returns the summary of the
+    run with the most queries a request ran and the number of failed requests.
+    Every scenario starts with empty caches, so that its results don't depend
+    on the scenarios run before it.
+    """
+    from django.db import close_old_connections, connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    clear_caches()
+
+    def call(index):
+        client = Client()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                status = request(client, index).status_code
+                elapsed = time.perf_counter() - started
+            return elapsed, len(queries), status
+        finally:
+            close_old_connections()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies, queries, statuses = zip(*executor.map(call, range(count)))
+    result = summarize(latencies, time.perf_counter() - started)
+    result['queries'] = max(queries)
+    result['failed'] = len([status for status in statuses if status != expected])
+    return result
+
+
+def compare(results, baselines, tolerance):
+    """
+    Regressions of `results` against the stored `baselines`.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result['queries'] > baseline['queries']:
+            regressions.append(f"{name}: {result['queries']} queries per request, baseline {baseline['queries']}")
+        if result['p95_ms'] > baseline['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms, baseline {baseline['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--items', type=int, default=10000000)
+    parser.add_argument('--database', type=str, default=None,
+                        help="SQLite file to seed, a temporary one by default")
+    parser.add_argument('--keep', action='store_true', help="keep the database, and reuse it if it's seeded")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the upstream takes to answer")
+    parser.add_argument('--scenario', action='append', help="only run these scenarios")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help="fail on a regression against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed growth of p95 with --check")
+    args = parser.parse_args()
+
+    upstream = start_upstream(args.latency, backlog=args.threads * 4)
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    # Every login comes from the same address.
+    settings.LOGIN_THROTTLE_IP_RATE = settings.LOGIN_THROTTLE_USERNAME_RATE = None
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), 'load.sqlite3')
+    teardown = setup_database(database, keep=args.keep)
+    try:
+        seed(args.users, args.items)
+        results = {}
+        print(f"{'scenario':<22}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'failed':>8}")
+        for name, (request, expected) in scenarios(args.users).items():
+            if args.scenario and name not in args.scenario:
+                continue
+            result = results[name] = run_scenario(request, expected, args.requests, args.threads)
+            print(f"{name:<22}{result['throughput']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                  f"{result['p99_ms']:>9}{result['queries']:>9}{result['failed']:>8}")
+    finally:
+        teardown()
+        upstream.shutdown()
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as baseline_file:
+            baselines = json.load(baseline_file)
+    if args.save_baseline:
+        baselines.update(results)
+        with open(BASELINES, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Saved the baseline to {BASELINES}")
+    if args.check:
+        regressions = compare(results, baselines, args.tolerance)
+        failed = [name for name, result in results.items() if result['failed']]
+        for regression in regressions:
+            print(f"Regression in {regression}")
+        for name in failed:
+            print(f"Failed requests in {name}")
+        if regressions or failed:
+            sys.exit(1)
+        print("No regression")
+
+
+if __name__ == '__main__':
+    main()
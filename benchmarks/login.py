@@ -0,0 +1,76 @@
+"""
+Logins per second on one core with each password hasher, through /login/ with
+the test client and throttling turned off. Hashers whose library isn't
+installed (argon2-cffi, bcrypt) are skipped. The last line is a client logging
+in again with the token it already holds, which skips hashing.
+
+    $ python benchmarks/login.py --logins 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.support import setup_database  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=20, help="logins timed per hasher")
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment
+
+    from calorie_app.hashers import TunedPBKDF2PasswordHasher
+
+    setup_test_environment()
+    teardown = setup_database(os.path.join(tempfile.mkdtemp(), 'login.sqlite3'))
+    hashers = [
+        ('Django PBKDF2 defaults', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'),
+        (f'PBKDF2, {TunedPBKDF2PasswordHasher().iterations} iterations', 'calorie_app.hashers.TunedPBKDF2PasswordHasher'),
+        (f'Argon2, t={settings.PASSWORD_ARGON2_TIME_COST} m={settings.PASSWORD_ARGON2_MEMORY_COST}KiB '
+         f'p={settings.PASSWORD_ARGON2_PARALLELISM}', 'calorie_app.hashers.TunedArgon2PasswordHasher'),
+        (f'BCrypt, {settings.PASSWORD_BCRYPT_ROUNDS} rounds', 'calorie_app.hashers.TunedBCryptSHA256PasswordHasher'),
+    ]
+    client = Client()
+    try:
+        with override_settings(LOGIN_THROTTLE_IP_RATE=None, LOGIN_THROTTLE_USERNAME_RATE=None):
+            for index, (name, path) in enumerate(hashers):
+                with override_settings(PASSWORD_HASHERS=[path]):
+                    try:
+                        password = make_password(PASSWORD)
+                    except ValueError as error:
+                        print(f"{name:<40} skipped: {error}")
+                        continue
+                    username = f'bench-login-{index}'
+                    User.objects.create(username=username, password=password)
+                    started = time.perf_counter()
+                    for _ in range(args.logins):
+                        response = client.post('/login/', {'username': username, 'password': PASSWORD})
+                        assert response.status_code == 201, response.content
+                    elapsed = time.perf_counter() - started
+                print(f"{name:<40} {args.logins / elapsed:8.1f} logins/s  {elapsed / args.logins * 1000:7.1f} ms each")
+
+            auth = f"token {response.data['token']}"
+            started = time.perf_counter()
+            for _ in range(args.logins):
+                client.post('/login/', {'username': username, 'password': PASSWORD}, HTTP_AUTHORIZATION=auth)
+            elapsed = time.perf_counter() - started
+            print(f"{'Token already held':<40} {args.logins / elapsed:8.1f} logins/s  {elapsed / args.logins * 1000:7.1f} ms each")
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Concurrent food item writers on one SQLite file, with Django's stock SQLite
+settings and with the production profile (SQLITE_PRODUCTION=1).
+
+Each of `--processes` worker processes, as many workers of a WSGI server, posts
+`--requests` food items with their calories through the test client, for a user
+of its own. Both runs start from a fresh database. Failed requests are mostly
+"database is locked" errors.
+
+    $ python benchmarks/sqlite_writers.py --processes 8 --requests 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.support import setup_database, summarize  # noqa: E402
+
+PROFILES = [('stock', '0'), ('production', '1')]
+
+
+def write(path, index, requests):
+    """
+    Worker process: posts `requests` food items as bench-writer-<index> and prints
+    its latencies, statuses and start and end times as JSON.
+    """
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from rest_framework.authtoken.models import Token
+
+    setup_test_environment()
+    connection.settings_dict['NAME'] = path
+    auth = f'token {Token.objects.get(user__username=f"bench-writer-{index}").key}'
+    client = Client(raise_request_exception=False)
+    latencies, statuses = [], []
+    started = time.time()
+    for number in range(requests):
+        begun = time.perf_counter()
+        response = client.post(
+            '/fooditem/', {'food_item': f'food {index}-{number}', 'num_of_calories': 100},
+            HTTP_AUTHORIZATION=auth
+        )
+        latencies.append(time.perf_counter() - begun)
+        statuses.append(response.status_code)
+    print(json.dumps({'latencies': latencies, 'statuses': statuses, 'started': started, 'ended': time.time()}))
+
+
+def run(profile, processes, requests):
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from rest_framework.authtoken.models import Token
+
+    from calorie_app.models import FoodItem, UserProfile
+
+    teardown = setup_database(os.path.join(tempfile.mkdtemp(), 'writers.sqlite3'))
+    path = connection.settings_dict['NAME']
+    for index in range(processes):
+        user = User.objects.create(username=f'bench-writer-{index}')
+        UserProfile.objects.create(user=user, max_calories=2000)
+        Token.objects.create(user=user)
+    connection.close()
+
+    env = dict(os.environ, SQLITE_PRODUCTION=profile)
+    workers = [
+        subprocess.Popen(
+            [sys.executable, __file__, '--worker', str(index), '--database', path, '--requests', str(requests)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        for index in range(processes)
+    ]
+    results = [json.loads(worker.communicate()[0]) for worker in workers]
+    latencies = [latency for result in results for latency in result['latencies']]
+    failed = len([status for result in results for status in result['statuses'] if status != 201])
+    elapsed = max(result['ended'] for result in results) - min(result['started'] for result in results)
+    stored = FoodItem.objects.count()
+    teardown()
+    return summarize(latencies, elapsed), failed, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="food items posted per process")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        write(args.database, args.worker, args.requests)
+        return
+
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    print(f"{args.processes} processes, {args.requests} food items each")
+    for name, profile in PROFILES:
+        stats, failed, stored = run(profile, args.processes, args.requests)
+        print(f"{name:<10} {stats['throughput']:8.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  "
+              f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  failed {failed}  stored {stored}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Shared pieces of the benchmark scripts: a fake Nutritionix, a scratch
+database and latency reporting. Import after putting the repository on
+sys.path; call django.setup() before setup_database().
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'calorie_project.settings')
+
+
+class SlowNutritionixHandler(BaseHTTPRequestHandler):
+    """
+    Answers every food with 100 calories after `latency` seconds.
+    """
+    latency = 0.2
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({"common": [], "branded": [{"nf_calories": 100}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_upstream(latency, backlog=128):
+    """
+    Starts the fake Nutritionix and points NUTRITIONIX_URL at it; must run before django.setup().
+    """
+    SlowNutritionixHandler.latency = latency
+    ThreadingHTTPServer.request_queue_size = backlog
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), SlowNutritionixHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    os.environ['NUTRITIONIX_URL'] = f'http://127.0.0.1:{upstream.server_port}/v2/search/instant'
+    return upstream
+
+
+def setup_database(path, keep=False):
+    """
+    Points the default database at a SQLite file at `path`, created from the
+    models. With `keep`, an existing file is reused. Returns a function
+    dropping it again.
+    """
+    from django.db import connection
+
+    database_name = connection.settings_dict['NAME']
+    connection.settings_dict['TEST'] = {'NAME': path, 'MIGRATE': False}
+    connection.creation.create_test_db(verbosity=0, keepdb=keep)
+
+    def teardown():
+        connection.creation.destroy_test_db(database_name, verbosity=0, keepdb=keep)
+    return teardown
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(share * len(values)) - 1))]
+
+
+def summarize(latencies, elapsed):
+    """
+    Throughput and latency percentiles (in milliseconds) of a run.
+    """
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from calorie_app. models import FoodItem, UserProfile
+from calorie_app. models import FoodCatalog, FoodItem, UserProfile
 # Register your models here.
 admin.site.register(FoodItem)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
+admin.site.register(FoodCatalog)
\ No newline at end of file
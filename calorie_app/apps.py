@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CalorieAppConfig(AppConfig):
     name = 'calorie_app'
+
+    def ready(self):
+        from calorie_app import signals  # noqa: F401
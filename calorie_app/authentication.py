@@ -0,0 +1,111 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from calorie_app.cache import LRUCache
+
+
+class TokenUserCache:
+    """
+    Maps token keys to their (user, token) pair, with the user's profile
+    already loaded but not their roles, which calorie_app.roles keeps fresh.
+    Entries live in an in-process LRU and in the AUTH_TOKEN_CACHE_ALIAS cache,
+    where a per-user version lets every worker notice invalidations. Without
+    that shared cache nothing is cached: a worker would keep serving deactivated
+    users, deleted tokens and stale profiles that another worker changed.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(max_entries=settings.AUTH_TOKEN_CACHE_MAX_ENTRIES)
+
+    @property
+    def shared(self):
+        alias = settings.AUTH_TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def _token_key(key):
+        return f'auth:token:{key}'
+
+    @staticmethod
+    def _version_key(user_id):
+        return f'auth:user-version:{user_id}'
+
+    def get(self, key):
+        shared = self.shared
+        if shared is None:
+            return None
+        entry = self.local.get(key)
+        if entry is None:
+            entry = shared.get(self._token_key(key))
+            if entry is None:
+                return None
+            self.local.set(key, entry, settings.AUTH_TOKEN_CACHE_TTL)
+        user, token, version = entry
+        if shared.get(self._version_key(user.pk), 0) != version:
+            self.local.delete(key)
+            return None
+        return entry
+
+    def set(self, key, user, token):
+        shared = self.shared
+        if shared is None:
+            return
+        entry = (user, token, shared.get(self._version_key(user.pk), 0))
+        self.local.set(key, entry, settings.AUTH_TOKEN_CACHE_TTL)
+        shared.set(self._token_key(key), entry, settings.AUTH_TOKEN_CACHE_TTL)
+
+    def invalidate_user(self, user_id):
+        self.local.delete_matching(lambda entry: entry[0].pk == user_id)
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.incr(self._version_key(user_id))
+            except ValueError:
+                shared.set(self._version_key(user_id), 1, None)
+
+    def invalidate_token(self, key, user_id):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._token_key(key))
+            # Other workers may still hold the token in their LRU.
+            self.invalidate_user(user_id)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        stats = self.local.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+token_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that skips the Token and User queries for tokens seen recently.
+    The cache is invalidated when the token is deleted, or the user, their profile
+    or their groups change (see calorie_app.signals).
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user', 'user__profile').get(key=key)
+            except model.DoesNotExist:
+                raise AuthenticationFailed('Invalid token.')
+            if not token.user.is_active:
+                raise AuthenticationFailed('User inactive or deleted.')
+            token_cache.set(key, token.user, token)
+            entry = (token.user, token, None)
+        user, token, _ = entry
+        # Requests may set attributes on their user, don't let them leak into the cache.
+        return (copy.copy(user), token)
@@ -0,0 +1,120 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from calorie_app.models import FoodItem
+from calorie_app.nutrition import lookup_calories_many
+from calorie_app.providers import ProviderUnavailable
+from calorie_app.rollups import add_to_daily_total, refresh_calories_exceeded
+from calorie_app.utils import normalize_food_name
+from calorie_app.versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_deferred():
+    """
+    Whether food items posted without calories are stored first and enriched afterwards.
+    """
+    return settings.NUTRITION_ENRICHMENT == 'deferred'
+
+
+def apply_calories(item, calories):
+    """
+    Stores the looked up `calories` of a pending item and updates what depends on them.
+    Returns False if another worker got there first.
+    """
+    with transaction.atomic():
+        pending = FoodItem.objects.filter(pk=item.pk, enrichment_status=FoodItem.ENRICHMENT_PENDING)
+        if calories is None:
+            updated = bool(pending.update(enrichment_status=FoodItem.ENRICHMENT_FAILED))
+            if updated:
+                bump_versions([item.user_id])
+            return updated
+        # The conditional update claims the item, so its calories are only counted once.
+        if not pending.update(num_of_calories=calories, enrichment_status=FoodItem.ENRICHMENT_DONE):
+            return False
+        bump_versions([item.user_id])
+        item.num_of_calories = calories
+        add_to_daily_total(item.user_id, item.local_date, calories, 0)
+        # Users without a profile, e.g. made with createsuperuser, have no limit.
+        refresh_calories_exceeded(item.user_id, item.local_date, bump=False)
+    return True
+
+
+def _record_failed_attempt(item):
+    """
+    Leaves `item` pending for another try, or fails it after NUTRITION_ENRICHMENT_MAX_ATTEMPTS.
+    """
+    failed = item.enrichment_attempts + 1 >= settings.NUTRITION_ENRICHMENT_MAX_ATTEMPTS
+    FoodItem.objects.filter(pk=item.pk, enrichment_status=FoodItem.ENRICHMENT_PENDING).update(
+        enrichment_attempts=F('enrichment_attempts') + 1,
+        enrichment_status=FoodItem.ENRICHMENT_FAILED if failed else FoodItem.ENRICHMENT_PENDING
+    )
+    if failed:
+        bump_versions([item.user_id])
+
+
+def enrich_pending(batch_size=100):
+    """
+    Looks up the calories of up to `batch_size` pending items, oldest first.
+    Items whose lookup or update keeps failing are given up on after
+    NUTRITION_ENRICHMENT_MAX_ATTEMPTS, so that they don't hold up the others.
+    Returns the number of items enriched, not found, and whose lookup failed.
+    """
+    items = list(
+        FoodItem.objects.filter(enrichment_status=FoodItem.ENRICHMENT_PENDING).order_by('id')[:batch_size]
+    )
+    counts = {'enriched': 0, 'not_found': 0, 'unavailable': 0}
+    if not items:
+        return counts
+    calories = lookup_calories_many(item.food_item for item in items)
+    for item in items:
+        found = calories.get(normalize_food_name(item.food_item))
+        if isinstance(found, ProviderUnavailable):
+            _record_failed_attempt(item)
+            counts['unavailable'] += 1
+            continue
+        try:
+            applied = apply_calories(item, found)
+        except Exception:
+            logger.exception("Enriching food item %s failed", item.pk)
+            _record_failed_attempt(item)
+            counts['unavailable'] += 1
+            continue
+        if applied:
+            counts['enriched' if found is not None else 'not_found'] += 1
+    return counts
+
+
+def _run_enrichment():
+    try:
+        enrich_pending()
+    except Exception:
+        logger.exception("Enriching pending food items failed")
+    finally:
+        connections.close_all()
+
+
+def schedule_enrichment():
+    """
+    Enriches pending items on a background thread, when NUTRITION_ENRICHMENT_THREADS > 0.
+    Otherwise they wait for the enrich_fooditems command.
+    """
+    global _executor
+    if not settings.NUTRITION_ENRICHMENT_THREADS:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NUTRITION_ENRICHMENT_THREADS,
+                thread_name_prefix='enrichment'
+            )
+    _executor.submit(_run_enrichment)
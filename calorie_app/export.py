@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Column name and the field it's read from.
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('user', 'user__username'),
+    ('timestamp', 'timestamp'),
+    ('local_date', 'local_date'),
+    ('food_item', 'food_item'),
+    ('num_of_calories', 'num_of_calories'),
+    ('calories_exceeded', 'calories_exceeded'),
+    ('enrichment_status', 'enrichment_status'),
+)
+
+
+class _Echo:
+    """
+    File-like object handing back what csv.writer writes to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _buffered(lines, size):
+    """
+    Joins `lines` into chunks of about `size` characters. The first line is
+    sent on its own, so that the response starts right away.
+    """
+    lines = iter(lines)
+    for line in lines:
+        yield line
+        break
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_lines(queryset, export_format, chunk_size=2000):
+    """
+    Yields the food items of `queryset` as CSV or JSONL lines.
+    Rows are fetched `chunk_size` at a time (with a server-side cursor where
+    the database has them), so memory doesn't grow with the number of rows.
+    """
+    names = [name for name, _ in EXPORT_COLUMNS]
+    if not queryset.query.order_by:
+        queryset = queryset.order_by('id')
+    rows = queryset.values_list(*[source for _, source in EXPORT_COLUMNS]).iterator(chunk_size=chunk_size)
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_response(queryset, export_format, chunk_size=2000):
+    """
+    StreamingHttpResponse sending the food items of `queryset` as they are read.
+    """
+    lines = export_lines(queryset, export_format, chunk_size)
+    response = StreamingHttpResponse(_buffered(lines, 64 * 1024), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="fooditems.{export_format}"'
+    return response
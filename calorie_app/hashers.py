@@ -0,0 +1,45 @@
+"""
+Password hashers whose cost comes from the settings (PASSWORD_*), so it can be
+tuned per deployment. A stored hash made with another cost, or another hasher
+than the first of PASSWORD_HASHERS, is redone with the current ones the next
+time its user logs in.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         BCryptSHA256PasswordHasher,
+                                         PBKDF2PasswordHasher)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Never fewer iterations than Django's own hasher.
+    """
+    @property
+    def iterations(self):
+        return max(settings.PASSWORD_PBKDF2_ITERATIONS or 0, PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Needs argon2-cffi.
+    """
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    """
+    Needs bcrypt.
+    """
+    @property
+    def rounds(self):
+        return settings.PASSWORD_BCRYPT_ROUNDS
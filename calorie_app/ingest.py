@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from calorie_app.models import FoodItem
+from calorie_app.nutrition import lookup_calories_many
+from calorie_app.providers import ProviderUnavailable
+from calorie_app.rollups import add_to_daily_total, refresh_calories_exceeded
+from calorie_app.serializers import CalorieLookupUnavailable, FoodItemSerializer
+from calorie_app.utils import normalize_food_name
+
+
+def _needs_lookup(payload):
+    return isinstance(payload, dict) and not payload.get('num_of_calories') and bool(payload.get('food_item'))
+
+
+def create_food_items(request, payloads):
+    """
+    Creates a batch of food items for `request.user` in a single transaction.
+    Missing calories are looked up once per distinct food, calories_exceeded is
+    worked out once per day for the whole batch, and one result
+    is returned per payload: its status and the created item or the errors.
+    """
+    user = request.user
+    calories = lookup_calories_many(
+        payload['food_item'] for payload in payloads if _needs_lookup(payload)
+    )
+
+    results = []
+    valid = []
+    for index, payload in enumerate(payloads):
+        result = {"index": index}
+        results.append(result)
+        if not isinstance(payload, dict):
+            result.update(status=400, errors={"non_field_errors": ["Expected a food item object."]})
+            continue
+        if _needs_lookup(payload):
+            found = calories.get(normalize_food_name(payload['food_item']))
+            if isinstance(found, ProviderUnavailable):
+                result.update(status=503, errors=CalorieLookupUnavailable.default_detail)
+                continue
+            if found is None:
+                result.update(status=400, errors={"food_item": "Please check the item and try again!"})
+                continue
+            payload = dict(payload, num_of_calories=found)
+        serializer = FoodItemSerializer(data=payload, context={'request': request})
+        if not serializer.is_valid():
+            result.update(status=400, errors=serializer.errors)
+            continue
+        valid.append((result, FoodItem(user=user, **serializer.validated_data)))
+
+    if not valid:
+        return results
+
+    with transaction.atomic():
+        items = [item for _, item in valid]
+        if connection.features.can_return_rows_from_bulk_insert:
+            FoodItem.objects.bulk_create(items)
+            # bulk_create doesn't send post_save, so the daily totals and
+            # calories_exceeded are updated here, once per day.
+            days = defaultdict(lambda: [0, 0])
+            for item in items:
+                day = days[item.local_date]
+                day[0] += item.num_of_calories or 0
+                day[1] += 1
+            flags = {}
+            for day, (total, count) in days.items():
+                add_to_daily_total(user.pk, day, total, count)
+                # Users without a profile, e.g. made with createsuperuser, have no limit.
+                flags.update(refresh_calories_exceeded(user.pk, day))
+            for item in items:
+                item.calories_exceeded = flags.get(item.pk, item.calories_exceeded)
+        else:
+            # Without ids coming back from a bulk insert the items are saved one by one.
+            for item in items:
+                item.save()
+
+    for result, item in valid:
+        result.update(status=201, item=FoodItemSerializer(item).data)
+    return results
@@ -0,0 +1,174 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calorie_app.models import UserProfile
+from calorie_app.roles import NORMAL_USER
+from calorie_app.search import index_values
+from calorie_app.utils import get_timezone, read_records
+from calorie_app.versions import bump_versions
+
+
+class InProcessExecutor:
+    """
+    Stand-in for the process pool with --workers 0.
+    """
+
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Imports users with their group and profile from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Defaults to the extension of the file')
+        parser.add_argument('--default-group', type=str, default=NORMAL_USER,
+                            help='Group of records without a `group` field')
+        parser.add_argument('--default-max-calories', type=int, default=2000,
+                            help='max_calories of records without a `max_calories` field')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords, 0 to hash them in this process')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError(f"Unknown file format: {file_format}")
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+
+        self.options = options
+        self.groups = dict(Group.objects.values_list('name', 'id'))
+        if options['default_group'] not in self.groups:
+            raise CommandError(f"Unknown group: {options['default_group']}")
+        self.seen = set()
+        self.imported = self.skipped = 0
+        self.started = time.monotonic()
+
+        if options['workers']:
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup)
+        else:
+            executor = InProcessExecutor()
+        chunksize = max(1, options['batch_size'] // (options['workers'] or 1) // 4)
+        try:
+            # The passwords of a batch are hashed while the previous batch is written.
+            pending = None
+            for batch in self.read_batches(path, file_format):
+                if not batch:
+                    continue
+                hashed = executor.map(make_password, [row['password'] for row in batch], chunksize=chunksize)
+                if pending is not None:
+                    self.save_batch(*pending)
+                pending = (batch, hashed)
+            if pending is not None:
+                self.save_batch(*pending)
+        finally:
+            executor.shutdown()
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} users in {elapsed:.1f}s ({self.imported / elapsed:.0f} users/s), "
+            f"skipped {self.skipped} records"
+        ))
+
+    def skip(self, line, reason):
+        self.skipped += 1
+        if self.options['verbosity'] >= 2:
+            self.stderr.write(f"Skipped record {line}: {reason}")
+
+    def clean_record(self, record):
+        """
+        The record as the fields of a new user, raises ValueError if it can't be imported.
+        """
+        try:
+            username = User._meta.get_field('username').clean(str(record.get('username') or '').strip(), None)
+        except ValidationError as error:
+            raise ValueError(f"invalid username, {' '.join(error.messages)}")
+        password = record.get('password')
+        if not password:
+            raise ValueError("no password")
+        group = record.get('group') or self.options['default_group']
+        if group not in self.groups:
+            raise ValueError(f"unknown group {group}")
+        try:
+            max_calories = int(record.get('max_calories') or self.options['default_max_calories'])
+        except (TypeError, ValueError):
+            raise ValueError("max_calories should be an integer")
+        if max_calories < 1:
+            raise ValueError("max_calories should be at least 1")
+        timezone = record.get('timezone') or ''
+        get_timezone(timezone)
+        return {
+            'username': username,
+            'password': str(password),
+            'group_id': self.groups[group],
+            'max_calories': max_calories,
+            'timezone': timezone,
+        }
+
+    def read_batches(self, path, file_format):
+        """
+        Yields lists of up to --batch-size valid records of usernames not taken yet.
+        """
+        batch = []
+        for line, record in enumerate(read_records(path, file_format), start=1):
+            try:
+                row = self.clean_record(record if isinstance(record, dict) else {})
+            except ValueError as error:
+                self.skip(line, error)
+                continue
+            if row['username'] in self.seen:
+                self.skip(line, f"duplicate username {row['username']}")
+                continue
+            self.seen.add(row['username'])
+            row['line'] = line
+            batch.append(row)
+            if len(batch) >= self.options['batch_size']:
+                yield self.drop_existing(batch)
+                batch = []
+        if batch:
+            yield self.drop_existing(batch)
+
+    def drop_existing(self, batch):
+        existing = set(User.objects.filter(
+            username__in=[row['username'] for row in batch]
+        ).values_list('username', flat=True))
+        for row in batch:
+            if row['username'] in existing:
+                self.skip(row['line'], f"user {row['username']} already exists")
+        return [row for row in batch if row['username'] not in existing]
+
+    def save_batch(self, batch, hashed):
+        users = [User(username=row['username'], password=password) for row, password in zip(batch, hashed)]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            # Not every backend returns the ids of a bulk insert.
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+            User.groups.through.objects.bulk_create(
+                User.groups.through(user_id=ids[row['username']], group_id=row['group_id']) for row in batch
+            )
+            UserProfile.objects.bulk_create(
+                UserProfile(user_id=ids[row['username']], max_calories=row['max_calories'], timezone=row['timezone'])
+                for row in batch
+            )
+            index_values('username', [user.username for user in users])
+        # bulk_create sends no signals: drop the user lists' ETags and cached pages.
+        bump_versions(ids.values())
+        self.imported += len(users)
+        if self.options['verbosity'] >= 1:
+            elapsed = time.monotonic() - self.started
+            self.stdout.write(f"Imported {self.imported} users ({self.imported / elapsed:.0f} users/s)")
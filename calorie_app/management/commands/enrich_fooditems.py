@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from calorie_app.enrichment import enrich_pending
+
+
+class Command(BaseCommand):
+    help = 'Looks up the calories of food items stored as pending'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for pending items instead of exiting once none are left')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait between polls when nothing is pending')
+
+    def handle(self, *args, **options):
+        totals = {'enriched': 0, 'not_found': 0, 'unavailable': 0}
+        while True:
+            counts = enrich_pending(options['batch_size'])
+            for key, value in counts.items():
+                totals[key] += value
+            if counts['enriched'] or counts['not_found']:
+                continue
+            # Nothing pending, or the provider is down: wait before asking again.
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Enriched {totals['enriched']} food items, {totals['not_found']} not found, "
+            f"{totals['unavailable']} lookups failed"
+        ))
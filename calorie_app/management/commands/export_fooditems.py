@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from py_rql.exceptions import RQLFilterError
+
+from calorie_app.export import EXPORT_FORMATS, export_lines
+from calorie_app.models import FoodFilter, FoodItem
+
+
+class Command(BaseCommand):
+    help = 'Streams food items as CSV or JSONL, optionally filtered by an RQL query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--username', type=str, action='append', default=[],
+                            help='Only export the items of this user, may be repeated')
+        parser.add_argument('--query', type=str, default='',
+                            help='RQL query, as accepted by /fooditem/, e.g. "ge(day,2021-01-01)"')
+        parser.add_argument('--output', type=str, default=None, help='Defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=settings.FOODITEM_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = FoodItem.objects.all()
+        if options['username']:
+            users = get_user_model().objects.filter(username__in=options['username'])
+            missing = set(options['username']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+            queryset = queryset.filter(user__in=users)
+        try:
+            _, queryset = FoodFilter(queryset).apply_filters(options['query'])
+        except RQLFilterError as error:
+            raise CommandError(f"Invalid query: {error}")
+
+        lines = export_lines(queryset, options['format'], options['chunk_size'])
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        written = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for line in lines:
+                output.write(line)
+                written += 1
+        if options['format'] == 'csv':
+            written -= 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} food items to {options['output']}"))
@@ -0,0 +1,69 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calorie_app.models import FoodCatalog
+from calorie_app.utils import read_records
+
+
+class Command(BaseCommand):
+    help = 'Loads a CSV or JSONL nutrition dataset into the local food catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Defaults to the extension of the file')
+        parser.add_argument('--name-field', type=str, default='name')
+        parser.add_argument('--calories-field', type=str, default='calories')
+        parser.add_argument('--source', type=str, default='')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true',
+                            help='Overwrite the calories of foods already in the catalog')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError(f"Unknown dataset format: {file_format}")
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+
+        loaded = skipped = 0
+        batch = {}
+        for record in read_records(path, file_format):
+            try:
+                entry = FoodCatalog.build(
+                    record[options['name_field']],
+                    record[options['calories_field']],
+                    options['source']
+                )
+            # Rounding raises OverflowError on infinite calories, e.g. 'inf' or 1e999.
+            except (KeyError, TypeError, ValueError, OverflowError):
+                skipped += 1
+                continue
+            if not entry.normalized_name:
+                skipped += 1
+                continue
+            batch[entry.normalized_name] = entry
+            if len(batch) >= options['batch_size']:
+                loaded += self.save_batch(batch, options['replace'])
+                batch = {}
+        if batch:
+            loaded += self.save_batch(batch, options['replace'])
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} foods into the catalog, skipped {skipped} records"))
+
+    @staticmethod
+    def save_batch(batch, replace):
+        with transaction.atomic():
+            if replace:
+                FoodCatalog.objects.filter(normalized_name__in=list(batch)).delete()
+            else:
+                existing = FoodCatalog.objects.filter(
+                    normalized_name__in=list(batch)
+                ).values_list('normalized_name', flat=True)
+                for normalized_name in existing:
+                    del batch[normalized_name]
+            FoodCatalog.objects.bulk_create(batch.values())
+        return len(batch)
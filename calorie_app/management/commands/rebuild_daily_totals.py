@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_app.rollups import rebuild_daily_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-user daily calorie totals from the food items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', type=str, action='append', default=[],
+                            help='Only rebuild this user, may be repeated')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['username']:
+            users = get_user_model().objects.filter(username__in=options['username'])
+            missing = set(options['username']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+        written = rebuild_daily_totals(users)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily totals"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from calorie_app.search import rebuild_search_index, use_trigram_table
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the trigrams of food item names and usernames used by RQL searches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not use_trigram_table():
+            raise CommandError("The trigram table isn't used with this database or SEARCH_TRIGRAM_INDEX off")
+        indexed = rebuild_search_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} distinct values"))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0006_auto_20200710_1817'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodCatalog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('normalized_name', models.CharField(max_length=200, unique=True)),
+                ('token_key', models.CharField(db_index=True, max_length=200)),
+                ('calories', models.IntegerField()),
+                ('source', models.CharField(blank=True, max_length=50)),
+            ],
+        ),
+    ]
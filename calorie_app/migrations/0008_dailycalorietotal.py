@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def fill_daily_totals(apps, schema_editor):
+    FoodItem = apps.get_model('calorie_app', 'FoodItem')
+    DailyCalorieTotal = apps.get_model('calorie_app', 'DailyCalorieTotal')
+    rows = FoodItem.objects.annotate(date=TruncDate('timestamp')).values('user_id', 'date').annotate(
+        total=Coalesce(Sum('num_of_calories'), 0),
+        count=Count('id')
+    ).order_by()
+    DailyCalorieTotal.objects.bulk_create(
+        (DailyCalorieTotal(user_id=row['user_id'], date=row['date'], total=row['total'], count=row['count'])
+         for row in rows),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0007_foodcatalog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCalorieTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(fill_daily_totals, migrations.RunPython.noop),
+    ]
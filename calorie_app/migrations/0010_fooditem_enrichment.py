@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0009_fooditem_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='enrichment_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='enrichment_status',
+            field=models.CharField(choices=[('done', 'Done'), ('pending', 'Pending'), ('failed', 'Failed')], default='done', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(condition=models.Q(('enrichment_status', 'pending')), fields=['id'], name='fooditem_pending_idx'),
+        ),
+    ]
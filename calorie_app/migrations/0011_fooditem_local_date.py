@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_local_dates(apps, schema_editor):
+    # Every profile starts out in TIME_ZONE, which TruncDate converts to.
+    FoodItem = apps.get_model('calorie_app', 'FoodItem')
+    FoodItem.objects.update(local_date=TruncDate('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0010_fooditem_enrichment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='local_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='timezone',
+            field=models.CharField(blank=True, default='', max_length=63),
+        ),
+        migrations.AlterField(
+            model_name='fooditem',
+            name='timestamp',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(fill_local_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fooditem',
+            name='local_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['user', 'local_date', 'num_of_calories'], name='fooditem_user_day_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+from calorie_app.search import trigrams
+
+# LIKE and ILIKE (which Django runs as UPPER(...) LIKE UPPER(...)) on both searchable columns.
+POSTGRES_INDEXES = [
+    ('fooditem_item_trgm', 'calorie_app_fooditem', '"food_item"'),
+    ('fooditem_item_upper_trgm', 'calorie_app_fooditem', 'UPPER("food_item"::text)'),
+    ('user_username_trgm', 'auth_user', '"username"'),
+    ('user_username_upper_trgm', 'auth_user', 'UPPER("username"::text)'),
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, expression in POSTGRES_INDEXES:
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({expression} gin_trgm_ops)')
+        return
+    SearchTrigram = apps.get_model('calorie_app', 'SearchTrigram')
+    sources = {
+        'food_item': apps.get_model('calorie_app', 'FoodItem').objects.values_list('food_item', flat=True),
+        'username': apps.get_model(settings.AUTH_USER_MODEL).objects.values_list('username', flat=True),
+    }
+    for field, values in sources.items():
+        rows = (
+            SearchTrigram(field=field, gram=gram, value=value)
+            for value in values.order_by().distinct().iterator() for gram in trigrams(value)
+        )
+        SearchTrigram.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, _, _ in POSTGRES_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0011_fooditem_local_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('gram', models.CharField(max_length=3)),
+                ('value', models.CharField(max_length=200)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['food_item', 'user'], name='fooditem_item_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchtrigram',
+            unique_together={('field', 'gram', 'value')},
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
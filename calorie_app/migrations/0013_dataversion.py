@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0012_searchtrigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('scope', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+                ('changed', models.FloatField()),
+            ],
+        ),
+    ]
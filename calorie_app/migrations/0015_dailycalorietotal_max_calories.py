@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_limits(apps, schema_editor):
+    # Days logged so far were flagged with the users' current limits.
+    DailyCalorieTotal = apps.get_model('calorie_app', 'DailyCalorieTotal')
+    UserProfile = apps.get_model('calorie_app', 'UserProfile')
+    DailyCalorieTotal.objects.update(max_calories=Subquery(
+        UserProfile.objects.filter(user_id=OuterRef('user_id')).values('max_calories')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorie_app', '0014_dataversion_changed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailycalorietotal',
+            name='max_calories',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_limits, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,233 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django_filters import rest_framework as filters
 from dj_rql.constants import FilterLookups
 from dj_rql.filter_cls import RQLFilterClass
 from dj_rql.constants import FilterLookups
 
+from calorie_app.search import index_values, search_q
+from calorie_app.utils import get_timezone, normalize_food_name
+from calorie_app.versions import bump_versions
+
 User = get_user_model()
+
+
+def local_date(user, timestamp):
+    """
+    Calendar day `timestamp` falls on in the time zone of `user`.
+    """
+    try:
+        name = user.profile.timezone
+    except UserProfile.DoesNotExist:
+        name = ''
+    return timezone.localdate(timestamp, get_timezone(name))
+
+
+class FoodItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            if obj.local_date is None:
+                obj.local_date = local_date(obj.user, obj.timestamp)
+        objs = super().bulk_create(objs, *args, **kwargs)
+        index_values('food_item', [obj.food_item for obj in objs])
+        bump_versions(obj.user_id for obj in objs)
+        return objs
+
+    def delete(self):
+        """
+        Deletes the items, then updates the total and flags of each day they were
+        logged on once, rather than once per item (see calorie_app.signals).
+        """
+        from calorie_app.rollups import refresh_calories_exceeded, refresh_daily_total
+
+        # The days are recomputed from the items left rather than by subtracting
+        # those read before the delete, which rows written in between would skew.
+        with transaction.atomic(using=self.db):
+            days = list(self.order_by().values('user_id', 'local_date').distinct())
+            deleted = super().delete()
+            for day in days:
+                refresh_daily_total(day['user_id'], day['local_date'])
+                refresh_calories_exceeded(day['user_id'], day['local_date'], bump=False)
+            bump_versions(day['user_id'] for day in days)
+        return deleted
+
+
 class FoodItem(models.Model):
+    ENRICHMENT_DONE = 'done'
+    ENRICHMENT_PENDING = 'pending'
+    ENRICHMENT_FAILED = 'failed'
+    ENRICHMENT_CHOICES = [
+        (ENRICHMENT_DONE, 'Done'),
+        (ENRICHMENT_PENDING, 'Pending'),
+        (ENRICHMENT_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set on creation like auto_now_add, but already known before saving to work out local_date.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, blank=True)
+    # Day of the timestamp in the user's time zone, what daily totals and limits go by.
+    local_date = models.DateField(editable=False)
     food_item = models.CharField(max_length=200, null=False, blank=False)
     num_of_calories = models.IntegerField(null=True, blank=True)
     calories_exceeded = models.BooleanField(default=False)
+    # Items stored before their calories were looked up, see calorie_app.enrichment.
+    enrichment_status = models.CharField(max_length=10, choices=ENRICHMENT_CHOICES, default=ENRICHMENT_DONE)
+    enrichment_attempts = models.IntegerField(default=0)
+
+    objects = FoodItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listing and RQL date filters filter by user and time.
+            models.Index(fields=['user', 'timestamp', 'num_of_calories'], name='fooditem_user_ts_idx'),
+            # A user's day, the calories make it a covering index for summing it.
+            models.Index(fields=['user', 'local_date', 'num_of_calories'], name='fooditem_user_day_idx'),
+            # RQL searches end up as an exact match on the names found in SearchTrigram.
+            models.Index(fields=['food_item', 'user'], name='fooditem_item_idx'),
+            # Admins filter everybody's items by date.
+            models.Index(fields=['timestamp'], name='fooditem_ts_idx'),
+            # The enrichment queue, only pending items are indexed.
+            models.Index(fields=['id'], name='fooditem_pending_idx', condition=models.Q(enrichment_status='pending')),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept to work out what an update changed, see calorie_app.signals.
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.local_date is None:
+            self.local_date = local_date(self.user, self.timestamp)
+        super().save(*args, **kwargs)
 
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, related_name='profile', on_delete=models.CASCADE)
     max_calories = models.IntegerField(validators=(MinValueValidator(1, message="Minimum calories for a day should be 1."),))
+    # IANA name like 'Europe/Paris', blank for TIME_ZONE.
+    timezone = models.CharField(max_length=63, blank=True, default='')
+
+
+class DailyCalorieTotal(models.Model):
+    """
+    Calories and number of food items a user logged on a day, kept up to date
+    on every FoodItem write (see calorie_app.rollups).
+    """
+    user = models.ForeignKey(User, related_name='daily_totals', on_delete=models.CASCADE)
+    date = models.DateField()
+    total = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+    # Limit the day's items are flagged by and the summary counts it over: the user's
+    # when the day was first logged on, or when it was changed that day. None
+    # for users without a profile.
+    max_calories = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+
+class SearchTrigram(models.Model):
+    """
+    Trigram of a distinct value of a searchable field, see calorie_app.search.
+    """
+    field = models.CharField(max_length=20)
+    gram = models.CharField(max_length=3)
+    value = models.CharField(max_length=200)
+
+    class Meta:
+        unique_together = ('field', 'gram', 'value')
+
+
+class DataVersion(models.Model):
+    """
+    Change version of a user's data, or of everybody's, see calorie_app.versions.
+    """
+    scope = models.CharField(max_length=20, primary_key=True)
+    token = models.CharField(max_length=32)
+    # The latest is the version of everybody's data.
+    changed = models.FloatField(db_index=True)
+
+
+class FoodCatalogQuerySet(models.QuerySet):
+    # Shorter queries would match too many unrelated foods by prefix.
+    PREFIX_MIN_LENGTH = 4
+
+    def lookup(self, name):
+        """
+        Best catalog entry for `name`, None if nothing matches.
+        Tries an exact match on the normalized name, then the same words in any
+        order, then the only entry starting with it; every step is an index lookup.
+        """
+        return self.lookup_many([name]).get(normalize_food_name(name))
+
+    def lookup_many(self, names):
+        """
+        lookup() of several names, as {normalized name: entry} of those found.
+        Exact and word order matches take one query for all the names, only
+        prefixes are looked up name by name.
+        """
+        keys = {normalize_food_name(name) for name in names} - {''}
+        found = {entry.normalized_name: entry for entry in self.filter(normalized_name__in=keys)}
+        by_token_key = {}
+        for key in keys.difference(found):
+            by_token_key.setdefault(FoodCatalog.token_key_for(key), []).append(key)
+        if by_token_key:
+            for entry in self.filter(token_key__in=by_token_key).order_by('-pk'):
+                # The oldest entry wins when several have the same words.
+                found.update(dict.fromkeys(by_token_key[entry.token_key], entry))
+        for key in keys.difference(found):
+            if len(key) < self.PREFIX_MIN_LENGTH:
+                continue
+            # A range rather than LIKE 'x%' so that every backend can use the index.
+            # Only an unambiguous prefix counts: "apple" isn't "apple pie".
+            matches = list(self.filter(normalized_name__gte=key, normalized_name__lt=key + '\uffff')[:2])
+            if len(matches) == 1:
+                found[key] = matches[0]
+        return found
+
+
+class FoodCatalog(models.Model):
+    """
+    Local table of common foods consulted before the nutrition provider.
+    """
+    name = models.CharField(max_length=200)
+    normalized_name = models.CharField(max_length=200, unique=True)
+    token_key = models.CharField(max_length=200, db_index=True)
+    calories = models.IntegerField()
+    source = models.CharField(max_length=50, blank=True)
+
+    objects = FoodCatalogQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.name} ({self.calories})'
+
+    @staticmethod
+    def token_key_for(normalized_name):
+        return ' '.join(sorted(normalized_name.split(' ')))
+
+    @classmethod
+    def build(cls, name, calories, source=''):
+        normalized = normalize_food_name(name)
+        return cls(
+            name=name.strip(),
+            normalized_name=normalized,
+            token_key=cls.token_key_for(normalized),
+            calories=round(float(calories)),
+            source=source
+        )
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_food_name(self.name)
+        self.token_key = self.token_key_for(self.normalized_name)
+        super().save(*args, **kwargs)
 
 
 class FoodFilter(RQLFilterClass):
@@ -37,6 +246,10 @@ class FoodFilter(RQLFilterClass):
         }, {
             'filter':'date',
             'source':'timestamp',
+        }, {
+            # The user's calendar day, e.g. day=2021-01-31 or ge(day,2021-01-01).
+            'filter':'day',
+            'source':'local_date',
         }, {
         # Some fields may have no DB representation or non-typical ORM filtering
         # `custom` option must be set to True for such fields
@@ -46,4 +259,11 @@ class FoodFilter(RQLFilterClass):
         'ordering': True,
         'search': True,
         'custom_data': [1],
-    }]
\ No newline at end of file
+    }]
+    def _build_django_q(self, filter_item, django_lookup, filter_lookup, typed_value):
+        # Every LIKE lookup, searches included, ends up here; `item` and `consumer`
+        # ones are answered from SearchTrigram rather than by scanning the items.
+        q = search_q(filter_item['orm_route'], django_lookup, typed_value)
+        if q is None:
+            return super()._build_django_q(filter_item, django_lookup, filter_lookup, typed_value)
+        return ~q if filter_lookup == FilterLookups.NE else q
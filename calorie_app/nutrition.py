@@ -0,0 +1,213 @@
+import contextvars
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+from calorie_app.cache import LRUCache
+from calorie_app.models import FoodCatalog
+from calorie_app.providers import ProviderUnavailable, get_provider
+from calorie_app.utils import normalize_food_name
+
+logger = logging.getLogger(__name__)
+
+# Stored in place of a calorie count for foods the upstream API doesn't know.
+NOT_FOUND = '__not_found__'
+
+
+class CalorieLookupCache:
+    """
+    Two-tier cache of calorie lookups keyed by the normalized food name:
+    an in-process LRU in front of a Django cache backend shared by all workers.
+    Foods the upstream doesn't know are cached as well, for a shorter time.
+    The shared tier is a database table by default: when it can't be read or
+    written, lookups carry on with the local tier and the provider.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(max_entries=settings.NUTRITION_CACHE_MAX_ENTRIES)
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[settings.NUTRITION_CACHE_ALIAS]
+
+    @staticmethod
+    def _shared_key(key):
+        return 'nutrition:' + hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _ttl(value):
+        if value == NOT_FOUND:
+            return settings.NUTRITION_CACHE_NEGATIVE_TTL
+        return settings.NUTRITION_CACHE_TTL
+
+    def _shared_get(self, key):
+        try:
+            return self.shared.get(self._shared_key(key))
+        except DatabaseError:
+            logger.warning("Reading the shared calorie cache failed", exc_info=True)
+            return None
+
+    def _shared_set(self, key, value):
+        try:
+            self.shared.set(self._shared_key(key), value, self._ttl(value))
+        except DatabaseError:
+            logger.warning("Writing the shared calorie cache failed", exc_info=True)
+
+    def get(self, query):
+        """
+        Returns the cached calories, NOT_FOUND, or None when nothing is cached.
+        """
+        key = normalize_food_name(query)
+        value = self.local.get(key)
+        if value is None:
+            value = self._shared_get(key)
+            if value is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self.local.set(key, value, self._ttl(value))
+        return value
+
+    def set(self, query, calories):
+        key = normalize_food_name(query)
+        value = NOT_FOUND if calories is None else calories
+        self._shared_set(key, value)
+        self.local.set(key, value, self._ttl(value))
+
+    def fetch(self, query, fetch):
+        """
+        Resolves a cache miss by calling `fetch` and storing its answer.
+        If `fetch` raises ProviderUnavailable an expired local entry is served instead.
+        """
+        with self._lock:
+            self.misses += 1
+        key = normalize_food_name(query)
+        try:
+            calories = fetch(key)
+        except ProviderUnavailable:
+            value = self.local.get_stale(key)
+            if value is None:
+                raise
+            return None if value == NOT_FOUND else value
+        self.set(key, calories)
+        return calories
+
+    async def afetch(self, query, afetch):
+        """
+        Async version of fetch(), for an `afetch` coroutine function.
+        """
+        with self._lock:
+            self.misses += 1
+        key = normalize_food_name(query)
+        try:
+            calories = await afetch(key)
+        except ProviderUnavailable:
+            value = self.local.get_stale(key)
+            if value is None:
+                raise
+            return None if value == NOT_FOUND else value
+        await sync_to_async(self.set)(key, calories)
+        return calories
+
+    def get_or_fetch(self, query, fetch):
+        """
+        Returns the calories of `query`, calling `fetch` only on a miss in both tiers.
+        """
+        value = self.get(query)
+        if value is None:
+            return self.fetch(query, fetch)
+        return None if value == NOT_FOUND else value
+
+    def clear(self):
+        self.local.clear()
+        self.shared_hits = self.misses = 0
+
+    def stats(self):
+        local = self.local.stats()
+        return {
+            'local_hits': local['hits'],
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'local_size': local['size'],
+        }
+
+
+lookup_cache = CalorieLookupCache()
+
+
+def find_calories_locally(food_item):
+    """
+    Looks `food_item` up in the catalog and the cache only, never calling the provider.
+    Returns (known, calories); calories is None for foods known not to exist.
+    """
+    entry = FoodCatalog.objects.lookup(food_item)
+    if entry is not None:
+        return True, entry.calories
+    value = lookup_cache.get(food_item)
+    if value is None:
+        return False, None
+    return True, None if value == NOT_FOUND else value
+
+
+def lookup_calories(food_item):
+    """
+    Calories of `food_item`, or None if it couldn't be found.
+    The local food catalog is consulted first, the provider only for foods it lacks.
+    Raises ProviderUnavailable when the provider is down and nothing is cached.
+    """
+    entry = FoodCatalog.objects.lookup(food_item)
+    if entry is not None:
+        return entry.calories
+    return lookup_cache.get_or_fetch(food_item, get_provider().lookup)
+
+
+async def alookup_calories(food_item):
+    """
+    Async version of lookup_calories(). The catalog and the cache are read on
+    a thread, the provider is awaited without holding one.
+    """
+    known, calories = await sync_to_async(find_calories_locally)(food_item)
+    if known:
+        return calories
+    return await lookup_cache.afetch(food_item, get_provider().alookup)
+
+
+def lookup_calories_many(food_items):
+    """
+    Calories of several food items, keyed by their normalized name.
+    Every distinct name is resolved once, and the ones neither the catalog nor
+    the cache know are sent to the provider concurrently. Values are the
+    calories, None for items that couldn't be found, or the ProviderUnavailable
+    error raised for the item.
+    """
+    keys = {normalize_food_name(food_item) for food_item in food_items}
+    results = {key: entry.calories for key, entry in FoodCatalog.objects.lookup_many(keys).items()}
+    missing = []
+    for key in keys.difference(results):
+        value = lookup_cache.get(key)
+        if value is None:
+            missing.append(key)
+        else:
+            results[key] = None if value == NOT_FOUND else value
+    if not missing:
+        return results
+
+    # Only the provider calls run in the pool, the cache is written from this thread.
+    provider = get_provider()
+    with ThreadPoolExecutor(max_workers=min(settings.NUTRITION_LOOKUP_WORKERS, len(missing))) as executor:
+        # Each call runs in a copy of this context, so it's timed towards the request's metrics.
+        futures = {key: executor.submit(contextvars.copy_context().run, provider.lookup, key) for key in missing}
+    for key, future in futures.items():
+        try:
+            results[key] = lookup_cache.fetch(key, lambda key: future.result())
+        except ProviderUnavailable as error:
+            results[key] = error
+    return results
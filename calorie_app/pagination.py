@@ -0,0 +1,149 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages through a queryset by the ordering values of the last row of the previous page.
+    Every page is a single indexed range query of `limit` + 1 rows, whatever its depth,
+    and no COUNT(*) is run.
+
+    The ordering comes from the queryset (e.g. an RQL `ordering()`) or else from the
+    view's `keyset_ordering`; the primary key is appended to make it unique.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_ordering(self, queryset, view):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering or len(ordering) != len(queryset.query.order_by):
+            ordering = list(getattr(view, 'keyset_ordering', ['id']))
+        pk_name = queryset.model._meta.pk.name
+        if not any(field.lstrip('-') in ('pk', pk_name) for field in ordering):
+            ordering.append(('-' if ordering[0].startswith('-') else '') + pk_name)
+        return ordering
+
+    def encode_cursor(self, row):
+        values = [getattr(row, field.lstrip('-')) for field in self.ordering]
+        # isoformat() keeps the microseconds that DjangoJSONEncoder would cut off.
+        data = json.dumps(values, default=lambda value: value.isoformat()).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, values):
+        """
+        Rows strictly after `values` in the ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{field.lstrip("-")}__{lookup}': values[position]})
+            for previous, value in zip(self.ordering[:position], values):
+                term &= Q(**{previous.lstrip('-'): value})
+            condition |= term
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(cursor))
+        rows = list(queryset[:self.limit + 1])
+        self.next_cursor = self.encode_cursor(rows[self.limit - 1]) if len(rows) > self.limit else None
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        # The query string is edited as text, re-encoding it would mangle RQL expressions.
+        url, _, query = self.request.build_absolute_uri().partition('?')
+        params = [
+            param for param in query.split('&')
+            if param and param.partition('=')[0] != self.cursor_query_param
+        ]
+        params.append(f'{self.cursor_query_param}={self.next_cursor}')
+        return f"{url}?{'&'.join(params)}"
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class SelectablePagination(BasePagination):
+    """
+    Limit/offset pagination by default, keyset pagination when PAGINATION_MODE is
+    'keyset' or a request asks for it with `?pagination=keyset` or a `cursor`.
+    """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.offset_pagination = LimitOffsetPagination()
+        self.keyset_pagination = KeysetPagination()
+        self.active = self.offset_pagination
+
+    def use_keyset(self, request):
+        mode = request.query_params.get(self.mode_query_param, settings.PAGINATION_MODE)
+        return mode == 'keyset' or self.keyset_pagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.active = self.keyset_pagination
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.offset_pagination.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.active.to_html()
+
+    def get_results(self, data):
+        return self.active.get_results(data)
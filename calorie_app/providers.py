@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from calorie_project.metrics import timed_external_call
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class ProviderUnavailable(Exception):
+    """
+    The nutrition provider failed to answer within its deadline, or its circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. After that a single trial call is let through:
+    success closes the circuit again, failure re-opens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class BaseNutritionProvider:
+    """
+    Looks up the calories of a food item.
+    """
+
+    def lookup(self, query):
+        """
+        Returns the calories of `query`, or None if the provider knows no such item.
+        Raises ProviderUnavailable when the provider can't be reached.
+        """
+        raise NotImplementedError
+
+    async def alookup(self, query):
+        """
+        Async version of lookup(). Unless a provider has a native one,
+        lookup() runs on a worker thread.
+        """
+        return await sync_to_async(self.lookup, thread_sensitive=False)(query)
+
+
+class NutritionixProvider(BaseNutritionProvider):
+    """
+    Nutritionix instant search over a pooled keep-alive session.
+    Each lookup is bounded by `deadline` seconds, across at most `retries` + 1
+    attempts with exponential backoff, and guarded by a circuit breaker.
+    alookup() uses an httpx.AsyncClient per event loop when httpx is installed.
+    """
+
+    def __init__(self, connect_timeout=1.0, read_timeout=2.0, deadline=4.0, retries=2,
+                 backoff=0.1, pool_size=10, failure_threshold=5, reset_timeout=30, async_pool_size=100):
+        self.url = settings.NUTRITIONIX_URL
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "x-app-id": settings.NUTRITIONIX_APP_ID,
+            "x-app-key": settings.NUTRITIONIX_APP_KEY,
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.async_pool_size = async_pool_size
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def parse(json_output):
+        if len(json_output['branded']) > 0:
+            return json_output['branded'][0]['nf_calories']
+        return None
+
+    def _pause(self, attempt, deadline):
+        """
+        Backoff before the next attempt, None if it wouldn't fit in the deadline.
+        """
+        pause = self.backoff * 2 ** attempt
+        return pause if time.monotonic() + pause < deadline else None
+
+    def lookup(self, query):
+        if not self.breaker.allow():
+            raise ProviderUnavailable("Nutritionix circuit is open")
+        try:
+            calories = self._lookup(query)
+        except BaseException:
+            # Whatever went wrong, a half-open circuit's trial must end.
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return calories
+
+    def _lookup(self, query):
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with timed_external_call('nutritionix'):
+                    response = self.session.get(
+                        self.url,
+                        params={'query': query},
+                        timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+                    )
+                response.raise_for_status()
+                return self.parse(response.json())
+            except (requests.RequestException, ValueError, KeyError) as exc:
+                error = exc
+                pause = self._pause(attempt, deadline)
+                if pause is None:
+                    break
+                time.sleep(pause)
+        raise ProviderUnavailable(f"Nutritionix lookup failed: {error}")
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=dict(self.session.headers),
+                limits=httpx.Limits(max_connections=self.async_pool_size)
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def alookup(self, query):
+        if httpx is None:
+            return await super().alookup(query)
+        if not self.breaker.allow():
+            raise ProviderUnavailable("Nutritionix circuit is open")
+        try:
+            calories = await self._alookup(query)
+        except BaseException:
+            # Cancellations included, a half-open circuit's trial must end.
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return calories
+
+    async def _alookup(self, query):
+        client = self._async_client()
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with timed_external_call('nutritionix'):
+                    response = await client.get(
+                        self.url,
+                        params={'query': query},
+                        timeout=httpx.Timeout(min(self.read_timeout, remaining), connect=min(self.connect_timeout, remaining))
+                    )
+                response.raise_for_status()
+                return self.parse(response.json())
+            except (httpx.HTTPError, ValueError, KeyError) as exc:
+                error = exc
+                pause = self._pause(attempt, deadline)
+                if pause is None:
+                    break
+                await asyncio.sleep(pause)
+        raise ProviderUnavailable(f"Nutritionix lookup failed: {error}")
+
+
+class FakeNutritionProvider(BaseNutritionProvider):
+    """
+    In-process provider answering from a fixed table, for tests and staging.
+    """
+    default_foods = {
+        "apple": 95,
+        "banana": 105,
+        "boiled egg": 78,
+        "chicken burger": 520,
+        "fried rice": 450,
+        "orange juice": 112,
+    }
+
+    def __init__(self, foods=None):
+        self.foods = self.default_foods if foods is None else foods
+        self.queries = []
+
+    def lookup(self, query):
+        self.queries.append(query)
+        return self.foods.get(query.lower())
+
+    async def alookup(self, query):
+        return self.lookup(query)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    The provider configured by the NUTRITION_PROVIDER setting, built once per process.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                provider_class = import_string(settings.NUTRITION_PROVIDER)
+                _provider = provider_class(**settings.NUTRITION_PROVIDER_OPTIONS)
+    return _provider
+
+
+@receiver(setting_changed)
+def _reset_provider(setting, **kwargs):
+    global _provider
+    if setting.startswith('NUTRITION'):
+        _provider = None
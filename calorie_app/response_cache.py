@@ -0,0 +1,55 @@
+"""
+In-process cache of food item list responses.
+
+Entries are keyed by who can see the data (the user, or every admin alike),
+the URL with its RQL query in a canonical order, and the change versions of
+the data it covers (see calorie_app.versions). A write to a user's items
+replaces their version, so their entries are never read again and age out of
+the LRU; other users' entries stay valid. Admins' entries cover everybody and
+go with any write.
+"""
+import copy
+from urllib.parse import unquote
+
+from django.conf import settings
+
+from calorie_app.cache import LRUCache
+
+list_cache = LRUCache(max_entries=settings.LIST_CACHE_MAX_ENTRIES, ttl=settings.LIST_CACHE_TTL)
+
+
+def normalize_query(query_string):
+    """
+    The `&`-separated terms of an RQL query outside parentheses, decoded and
+    sorted: `limit=5&eq(item,Rice)` and `eq(item,Rice)&limit=5` give the same key.
+    """
+    terms, depth, start = [], 0, 0
+    query_string = unquote(query_string)
+    for index, char in enumerate(query_string):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '&' and depth == 0:
+            terms.append(query_string[start:index])
+            start = index + 1
+    terms.append(query_string[start:])
+    return '&'.join(sorted(term for term in terms if term))
+
+
+def cache_key(request, versions):
+    """
+    Key of the list response to `request` covering the data of `versions` ({scope: version}).
+    """
+    return (
+        request.build_absolute_uri(request.path),
+        normalize_query(request.META.get('QUERY_STRING', '')),
+    ) + tuple(sorted((str(scope), token) for scope, (token, _) in versions.items()))
+
+
+def detach(data):
+    """
+    Copy of serialized `data` without the serializer it refers to.
+    """
+    # ReturnDict and ReturnList deep-copy to a plain dict and list.
+    return copy.deepcopy(data)
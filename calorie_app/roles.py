@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+
+ADMINISTRATOR = 'Administrator'
+USER_MANAGER = 'User_Manager'
+NORMAL_USER = 'Normal_User'
+
+
+def _cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+def get_roles(user):
+    """
+    Names of the groups `user` belongs to.
+    They're read once per user object, so once per request, and shared across
+    requests through the default cache for ROLES_CACHE_TIMEOUT seconds when it's
+    shared by every worker.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_role_names', None)
+    if roles is None:
+        timeout = settings.ROLES_CACHE_TIMEOUT
+        if timeout:
+            roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            if timeout:
+                cache.set(_cache_key(user.pk), roles, timeout)
+        user._role_names = roles
+    return roles
+
+
+def has_role(user, roles):
+    """
+    Whether `user` belongs to at least one of the `roles` groups.
+    """
+    return not get_roles(user).isdisjoint(roles)
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,134 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+
+from calorie_app.models import DailyCalorieTotal, FoodItem, UserProfile
+from calorie_app.versions import bump_versions
+
+
+def current_limit(user_id):
+    """
+    The user's max_calories, as a subquery to store along with a new day.
+    """
+    return Subquery(UserProfile.objects.filter(user_id=user_id).values('max_calories')[:1])
+
+
+def add_to_daily_total(user_id, date, calories, count):
+    """
+    Atomically adds `calories` and `count` to the user's total for `date`.
+    The row is created the first time something is added to a day, with the
+    user's current limit.
+    """
+    rows = DailyCalorieTotal.objects.filter(user_id=user_id, date=date)
+    if rows.update(total=F('total') + calories, count=F('count') + count) or count <= 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyCalorieTotal.objects.create(
+                user_id=user_id, date=date, total=calories, count=count, max_calories=current_limit(user_id)
+            )
+    except IntegrityError:
+        # Another request created the row in the meantime.
+        rows.update(total=F('total') + calories, count=F('count') + count)
+
+
+def refresh_daily_total(user_id, date):
+    """
+    Recomputes a single day of a user from its food items.
+    """
+    row = FoodItem.objects.filter(user_id=user_id, local_date=date).aggregate(
+        total=Coalesce(Sum('num_of_calories'), 0),
+        count=Count('id')
+    )
+    if row['count']:
+        DailyCalorieTotal.objects.update_or_create(
+            user_id=user_id, date=date, defaults=row, create_defaults={**row, 'max_calories': current_limit(user_id)}
+        )
+    else:
+        DailyCalorieTotal.objects.filter(user_id=user_id, date=date).delete()
+
+
+def refresh_calories_exceeded(user_id, date, bump=True):
+    """
+    Re-flags a user's food items of `date`: an item exceeds the limit when the calories
+    logged that day up to and including it are over the day's max_calories. The running
+    sums come from a single window query and only the flags that change are written,
+    which bumps the user's version unless `bump` is False (the caller bumps it anyway).
+    Returns {id: calories_exceeded} of the changed items.
+    """
+    max_calories = DailyCalorieTotal.objects.filter(
+        user_id=user_id, date=date
+    ).values_list('max_calories', flat=True).first()
+    if max_calories is None:
+        return {}
+    items = FoodItem.objects.filter(user_id=user_id, local_date=date).annotate(
+        consumed=Window(Sum(Coalesce('num_of_calories', 0)), order_by=[F('timestamp').asc(), F('id').asc()])
+    ).only('id', 'calories_exceeded')
+    changed = []
+    for item in items:
+        exceeded = item.consumed > max_calories
+        if item.calories_exceeded != exceeded:
+            item.calories_exceeded = exceeded
+            changed.append(item)
+    FoodItem.objects.bulk_update(changed, ['calories_exceeded'])
+    if changed and bump:
+        bump_versions([user_id])
+    return {item.pk: item.calories_exceeded for item in changed}
+
+
+SUMMARY_PERIODS = {
+    'day': F,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def summarize_daily_totals(user_id, start, end, period):
+    """
+    Calories, items and days over their limit of a user from `start` to `end`
+    (both included), per day, week (starting on Monday) or month with any food logged.
+    Only the daily totals are read, so the cost follows the number of days
+    and not the number of food items.
+    """
+    return list(
+        DailyCalorieTotal.objects.filter(user_id=user_id, date__gte=start, date__lte=end)
+        .annotate(start=SUMMARY_PERIODS[period]('date'))
+        .values('start')
+        .annotate(
+            calories=Sum('total'),
+            items=Sum('count'),
+            exceeded_days=Count('id', filter=Q(total__gt=F('max_calories')))
+        )
+        .order_by('start')
+    )
+
+
+def rebuild_daily_totals(users=None):
+    """
+    Recomputes the daily totals of `users` (everybody by default) from their food items.
+    Returns the number of rows written.
+    """
+    items = FoodItem.objects.all()
+    totals = DailyCalorieTotal.objects.all()
+    profiles = UserProfile.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+        totals = totals.filter(user__in=users)
+        profiles = profiles.filter(user__in=users)
+    rows = items.values('user_id', 'local_date').annotate(
+        total=Coalesce(Sum('num_of_calories'), 0),
+        count=Count('id')
+    ).order_by()
+    with transaction.atomic():
+        # Days keep their limit, new ones get the user's.
+        limits = {(user_id, date): limit for user_id, date, limit in totals.values_list('user_id', 'date', 'max_calories')}
+        current = dict(profiles.values_list('user_id', 'max_calories'))
+        totals.delete()
+        created = DailyCalorieTotal.objects.bulk_create(
+            (DailyCalorieTotal(
+                user_id=row['user_id'], date=row['local_date'], total=row['total'], count=row['count'],
+                max_calories=limits.get((row['user_id'], row['local_date']), current.get(row['user_id']))
+            ) for row in rows),
+            batch_size=1000
+        )
+    return len(created)
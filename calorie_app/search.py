@@ -0,0 +1,123 @@
+"""
+Indexed LIKE searches on food item names and usernames.
+
+A LIKE '%rice%' can't use a B-tree index, so RQL searches (`like(item,*rice*)`,
+`ilike(consumer,*bob*)`, `search=rice`) used to scan every food item. On
+backends without trigram indexes, every distinct value of the searchable
+fields is broken into trigrams stored in SearchTrigram. A search then reads the
+values sharing all the trigrams of the pattern, checks the pattern against
+them, and filters the items by those values with an index. Its cost depends on
+the number of distinct values, not of items.
+
+On PostgreSQL, migration 0012 creates pg_trgm GIN indexes instead and the
+lookups are left as they are.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+
+from dj_rql.constants import DjangoLookups
+
+# ORM route of each searchable field, and the name its values are stored under.
+SEARCH_FIELDS = {
+    'food_item': 'food_item',
+    'user__username': 'username',
+}
+
+# Lookups answered from the trigrams. Exact matches already have an index, and
+# regular expressions (patterns with inner `*`) are left to the database.
+TRIGRAM_LOOKUPS = {
+    DjangoLookups.I_EXACT,
+    DjangoLookups.CONTAINS,
+    DjangoLookups.I_CONTAINS,
+    DjangoLookups.STARTSWITH,
+    DjangoLookups.I_STARTSWITH,
+    DjangoLookups.ENDSWITH,
+    DjangoLookups.I_ENDSWITH,
+}
+
+
+def trigrams(value):
+    """
+    Lower-cased three-character substrings of `value`, none if it's shorter.
+    """
+    value = str(value or '').lower()
+    return {value[index:index + 3] for index in range(len(value) - 2)}
+
+
+def use_trigram_table():
+    return settings.SEARCH_TRIGRAM_INDEX and connection.vendor != 'postgresql'
+
+
+def index_values(field, values):
+    """
+    Stores the trigrams of `values` of the searchable `field`, skipping those already stored.
+    """
+    from calorie_app.models import SearchTrigram
+
+    if not use_trigram_table():
+        return
+    values = sorted({value for value in values if trigrams(value)})
+    for start in range(0, len(values), 500):
+        chunk = values[start:start + 500]
+        # A value's trigrams are stored together, any of them means it's indexed.
+        # Most writes reuse a known name and stop at this query.
+        indexed = set(
+            SearchTrigram.objects.filter(field=field, value__in=chunk).values_list('value', flat=True).distinct()
+        )
+        rows = [
+            SearchTrigram(field=field, gram=gram, value=value)
+            for value in chunk if value not in indexed for gram in trigrams(value)
+        ]
+        SearchTrigram.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+def search_q(orm_route, django_lookup, value):
+    """
+    Q matching the items whose `orm_route` matches `value` with `django_lookup`
+    through the trigram table. None when the table can't answer it, e.g. for
+    patterns shorter than three characters, which match too many values for an
+    index to help anyway.
+    """
+    from calorie_app.models import SearchTrigram
+
+    field = SEARCH_FIELDS.get(orm_route)
+    if field is None or django_lookup not in TRIGRAM_LOOKUPS or not use_trigram_table():
+        return None
+    grams = trigrams(value)
+    if not grams:
+        return None
+    matching = SearchTrigram.objects.filter(field=field, gram__in=grams).values('value').annotate(
+        grams=Count('gram')
+    ).filter(grams=len(grams), **{f'value__{django_lookup}': value}).order_by().values('value')
+    return Q(**{f'{orm_route}__in': matching})
+
+
+def rebuild_search_index(batch_size=1000):
+    """
+    Rebuilds SearchTrigram from the current values, dropping those no longer
+    used by any row. Returns the number of distinct values indexed.
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+
+    from calorie_app.models import FoodItem, SearchTrigram
+
+    sources = {
+        'food_item': FoodItem.objects.values_list('food_item', flat=True),
+        'username': get_user_model().objects.values_list('username', flat=True),
+    }
+    indexed = 0
+    with transaction.atomic():
+        SearchTrigram.objects.all().delete()
+        for field, values in sources.items():
+            batch = []
+            for value in values.order_by().distinct().iterator(chunk_size=batch_size):
+                batch.append(value)
+                if len(batch) >= batch_size:
+                    index_values(field, batch)
+                    indexed += len(batch)
+                    batch = []
+            index_values(field, batch)
+            indexed += len(batch)
+    return indexed
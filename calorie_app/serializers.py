@@ -1,53 +1,70 @@
-import json
-from datetime import datetime
+from datetime import timedelta
 
-import requests
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.models import Group, User
-from django.db.models import Sum
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import APIException, PermissionDenied
+
+from calorie_app.models import DailyCalorieTotal, FoodItem, UserProfile, local_date
+from calorie_app.enrichment import is_deferred, schedule_enrichment
+from calorie_app.nutrition import find_calories_locally, lookup_calories
+from calorie_app.providers import ProviderUnavailable
+from calorie_app.rollups import SUMMARY_PERIODS, refresh_calories_exceeded
+from calorie_app.utils import get_timezone
+
+class CalorieLookupUnavailable(APIException):
+    status_code = 503
+    default_detail = {"food_item":"Calorie lookup is unavailable, please enter num_of_calories."}
+    default_code = 'service_unavailable'
 
-from calorie_app.models import FoodItem, UserProfile
 
 class FoodItemSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     class Meta:
         model = FoodItem
         fields = '__all__'
-        read_only_fields = ['user', 'timestamp', 'calories_exceeded', 'id']
+        read_only_fields = ['user', 'timestamp', 'calories_exceeded', 'id', 'enrichment_status', 'enrichment_attempts']
         ordering = ['-timestamp']
 
     def validate(self, data):
         food_item = data.get('food_item', "")
         num_of_calories = data.get('num_of_calories', "")
-        if num_of_calories == 0 or num_of_calories is None or num_of_calories =="" :       
-            HEADERS = {
-                "x-app-id":"f26e0228",
-                "x-app-key":"130a3ebf8a86195fe3f8632d6b346c1b",
-                "Content-Type": "application/json"
-            }
-
-            url = f"https://trackapi.nutritionix.com/v2/search/instant?query={food_item}"
-            response = requests.get(url, headers=HEADERS)
-            json_output = json.loads(response.content.decode('utf-8'))
-            if len(json_output['branded'])>0:
-                data["num_of_calories"] = json_output['branded'][0]['nf_calories']
+        if num_of_calories == 0 or num_of_calories is None or num_of_calories =="" :
+            if is_deferred():
+                known, calories = find_calories_locally(food_item)
+                if not known:
+                    # Stored right away, the calories are filled in by calorie_app.enrichment.
+                    data["num_of_calories"] = None
+                    data["enrichment_status"] = FoodItem.ENRICHMENT_PENDING
+                    return data
+            else:
+                try:
+                    calories = lookup_calories(food_item)
+                except ProviderUnavailable:
+                    raise CalorieLookupUnavailable()
+            if calories is not None:
+                data["num_of_calories"] = calories
             else:
                 raise ValidationError({"food_item":"Please check the item and try again!"},404)
+        data["enrichment_status"] = FoodItem.ENRICHMENT_DONE
         return data
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        max_calories = validated_data['user'].profile.max_calories
-        calories_consumed_today = FoodItem.objects.filter(
-            user=validated_data['user'], 
-            timestamp__gte=datetime.now().replace(hour=0, minute=0, second=0)
-            ).aggregate(Sum('num_of_calories'))['num_of_calories__sum']
-        if calories_consumed_today is not None:
-            validated_data['calories_exceeded'] = calories_consumed_today > max_calories
+        # calories_exceeded is worked out when the item is saved, see calorie_app.signals.
         fooditem = FoodItem.objects.create(**validated_data)        
+        if fooditem.enrichment_status == FoodItem.ENRICHMENT_PENDING:
+            transaction.on_commit(schedule_enrichment)
+        return fooditem
+
+    def update(self, instance, validated_data):
+        fooditem = super().update(instance, validated_data)
+        if fooditem.enrichment_status == FoodItem.ENRICHMENT_PENDING:
+            transaction.on_commit(schedule_enrichment)
         return fooditem
 
 
@@ -76,9 +93,16 @@ class ProfileSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     class Meta:
         model = UserProfile
-        fields = ['user', 'max_calories']
+        fields = ['user', 'max_calories', 'timezone']
         extra_kwargs = {'user':{'read_only':True}}  
 
+    def validate_timezone(self, value):
+        try:
+            get_timezone(value)
+        except ValueError:
+            raise ValidationError("Please enter a valid time zone, like Europe/Paris.")
+        return value
+
 
 class UserRegisterSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer()
@@ -103,7 +127,7 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         user.set_password(password)
         for group in groups:
             user.groups.add(group)
-        UserProfile.objects.create(user=user, max_calories=profile_data['max_calories'])
+        UserProfile.objects.create(user=user, max_calories=profile_data['max_calories'], timezone=profile_data.get('timezone', ''))
         user.save()
         return user
 
@@ -126,9 +150,36 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             if validated_data.get('profile', None):
                 profile_data = validated_data.pop('profile')
                 profile = instance.profile
+                old_max_calories = profile.max_calories
                 profile.max_calories = profile_data.get('max_calories', profile.max_calories)
+                profile.timezone = profile_data.get('timezone', profile.timezone)
                 profile.save()
+                if profile.max_calories != old_max_calories:
+                    # Past days keep the limit they were logged under, today takes the new one.
+                    today = local_date(instance, timezone.now())
+                    DailyCalorieTotal.objects.filter(user=instance, date=today).update(max_calories=profile.max_calories)
+                    refresh_calories_exceeded(instance.pk, today)
         except UserProfile.DoesNotExist:
             instance.profile = UserProfile.objects.create(user=instance, **profile_data)
         instance.save()
-        return instance 
\ No newline at end of file
+        return instance 
+
+
+class CalorieSummaryQuerySerializer(serializers.Serializer):
+    """
+    Query of the calorie summary: the last SUMMARY_DEFAULT_DAYS days per day by default,
+    ending today in the requesting user's time zone.
+    """
+    period = serializers.ChoiceField(choices=list(SUMMARY_PERIODS), default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    user = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        data['end'] = data.get('end') or local_date(self.context['request'].user, timezone.now())
+        data['start'] = data.get('start') or data['end'] - timedelta(days=settings.SUMMARY_DEFAULT_DAYS - 1)
+        if data['start'] > data['end']:
+            raise ValidationError({"start":"start can't be after end."})
+        if (data['end'] - data['start']).days >= settings.SUMMARY_MAX_DAYS:
+            raise ValidationError({"start":f"At most {settings.SUMMARY_MAX_DAYS} days can be summarized at once."})
+        return data
@@ -0,0 +1,135 @@
+from django.contrib.auth.models import Group, User
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from calorie_app.authentication import token_cache
+from calorie_app.models import FoodItem, FoodItemQuerySet, UserProfile
+from calorie_app.roles import invalidate_roles
+from calorie_app.rollups import add_to_daily_total, refresh_calories_exceeded
+from calorie_app.search import index_values
+from calorie_app.versions import bump_versions
+
+
+def _refresh_calories_exceeded(instance, days):
+    for user_id, day in days:
+        flags = refresh_calories_exceeded(user_id, day, bump=False)
+        if user_id == instance.user_id and instance.pk in flags:
+            instance.calories_exceeded = flags[instance.pk]
+
+
+# What update_daily_total_on_save() diffs a saved item against.
+_DIFFED_FIELDS = ('user_id', 'local_date', 'num_of_calories')
+
+
+@receiver(pre_save, sender=FoodItem)
+def load_stored_values(sender, instance, raw=False, **kwargs):
+    # An item saved without those fields loaded first, e.g. read with only(),
+    # may still move its calories away from a day: read what's stored.
+    loaded = getattr(instance, '_loaded_values', {})
+    if raw or instance.pk is None or all(field in loaded for field in _DIFFED_FIELDS):
+        return
+    stored = FoodItem.objects.filter(pk=instance.pk).values(*_DIFFED_FIELDS).first()
+    if stored is not None:
+        instance._loaded_values = {**stored, **loaded}
+
+
+@receiver(post_save, sender=FoodItem)
+def update_daily_total_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    calories = instance.num_of_calories or 0
+    new_day = instance.local_date
+    days = {(instance.user_id, new_day)}
+    if created:
+        add_to_daily_total(instance.user_id, new_day, calories, 1)
+    else:
+        old = instance._loaded_values
+        old_calories = old['num_of_calories'] or 0
+        old_user_id = old['user_id']
+        old_day = old['local_date']
+        if (old_user_id, old_day) == (instance.user_id, new_day):
+            if calories == old_calories:
+                days = set()
+            else:
+                add_to_daily_total(instance.user_id, new_day, calories - old_calories, 0)
+        else:
+            add_to_daily_total(old_user_id, old_day, -old_calories, -1)
+            add_to_daily_total(instance.user_id, new_day, calories, 1)
+            days.add((old_user_id, old_day))
+    _refresh_calories_exceeded(instance, days)
+    bump_versions({instance.user_id} | {user_id for user_id, _ in days})
+    instance._loaded_values = {
+        'user_id': instance.user_id,
+        'local_date': instance.local_date,
+        'num_of_calories': instance.num_of_calories,
+    }
+
+
+@receiver(post_delete, sender=FoodItem)
+def update_daily_total_on_delete(sender, instance, origin=None, **kwargs):
+    # FoodItemQuerySet.delete() updates each day once after deleting, and the
+    # totals of a user being deleted go along with them.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if isinstance(origin, FoodItemQuerySet) or origin_model is User:
+        return
+    add_to_daily_total(instance.user_id, instance.local_date, -(instance.num_of_calories or 0), -1)
+    refresh_calories_exceeded(instance.user_id, instance.local_date, bump=False)
+    bump_versions([instance.user_id])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if reverse:
+        # group.user_set was changed, clearing it doesn't tell which users were members.
+        user_ids = pk_set if pk_set is not None else list(instance.user_set.values_list('pk', flat=True))
+    else:
+        instance.__dict__.pop('_role_names', None)
+        user_ids = [instance.pk]
+    invalidate_roles(user_ids)
+    bump_versions(user_ids)
+    for user_id in user_ids:
+        token_cache.invalidate_user(user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    user_ids = list(instance.user_set.values_list('pk', flat=True))
+    invalidate_roles(user_ids)
+    for user_id in user_ids:
+        token_cache.invalidate_user(user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_tokens_on_user_change(sender, instance, update_fields=None, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+    # Logging in only updates last_login, which no response shows.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_versions([instance.pk])
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_tokens_on_profile_change(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
+    bump_versions([instance.user_id])
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_save, sender=User)
+def index_search_values(sender, instance, raw=False, update_fields=None, **kwargs):
+    field = 'food_item' if sender is FoodItem else 'username'
+    if raw or (update_fields is not None and field not in update_fields):
+        return
+    index_values(field, [getattr(instance, field)])
@@ -0,0 +1,58 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per key, kept in the default cache: a bucket holds up to
+    `capacity` requests and refills completely in `seconds`. The rate,
+    (capacity, seconds) or None for no limit, is read from the `rate_setting` setting.
+    Concurrent requests on the same key may both take the last token: the limit is approximate.
+    """
+    rate_setting = None
+    scope = None
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = getattr(settings, self.rate_setting)
+        ident = self.get_key(request)
+        if rate is None or ident is None:
+            return True
+        capacity, seconds = rate
+        refill = capacity / seconds
+        key = f'throttle:{self.scope}:{hashlib.sha1(ident.encode("utf-8")).hexdigest()}'
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill
+            return False
+        # Untouched for `seconds`, the bucket is full again and can be forgotten.
+        cache.set(key, (tokens - 1, now), seconds)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    rate_setting = 'LOGIN_THROTTLE_IP_RATE'
+    scope = 'login-ip'
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    rate_setting = 'LOGIN_THROTTLE_USERNAME_RATE'
+    scope = 'login-username'
+
+    def get_key(self, request):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        return str(username).strip() if username else None
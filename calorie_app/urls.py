@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from calorie_app import views as app_views
@@ -8,6 +9,19 @@ fooditem_list = app_views.FoodItemView.as_view({
 }
 )
 
+if settings.ASYNC_FOODITEM_VIEWS:
+    from calorie_app.async_views import fooditem_list
+
+fooditem_bulk = app_views.FoodItemView.as_view({
+    'post':'bulk_create'
+}
+)
+
+fooditem_export = app_views.FoodItemView.as_view({
+    'get':'export'
+}
+)
+
 fooditem_detail = app_views.FoodItemView.as_view(
     {
         'get':'retrieve',
@@ -37,5 +51,8 @@ urlpatterns = [
     path('users/<int:pk>/', users, name='user-details'),
     path('login/', app_views.UserLoginView.as_view(), name='login'),
     path('fooditem/', fooditem_list, name='fooditem'),
+    path('fooditem/bulk/', fooditem_bulk, name='fooditem-bulk'),
+    path('fooditem/export/', fooditem_export, name='fooditem-export'),
     path('fooditem/<int:pk>/', fooditem_detail, name='food-details'),
+    path('summary/', app_views.CalorieSummaryView.as_view(), name='summary'),
 ]
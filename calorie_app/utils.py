@@ -0,0 +1,48 @@
+import csv
+import json
+import re
+from functools import lru_cache
+
+from django.utils import timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    from pytz import timezone as ZoneInfo
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_food_name(name):
+    """
+    Canonical form of a food name used as a lookup key:
+    "  Chicken   BURGER " and "chicken burger" map to the same entry.
+    """
+    return _WHITESPACE.sub(' ', str(name or '')).strip().lower()
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """
+    tzinfo of the IANA time zone `name`, TIME_ZONE when `name` is empty.
+    Raises ValueError for unknown zones.
+    """
+    if not name:
+        return timezone.get_default_timezone()
+    try:
+        return ZoneInfo(name)
+    except (KeyError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def read_records(path, file_format):
+    """
+    Yields the records of a CSV (as dicts keyed by its header) or JSONL file one at a time.
+    """
+    with open(path, newline='', encoding='utf-8') as dataset:
+        if file_format == 'csv':
+            yield from csv.DictReader(dataset)
+        else:
+            for line in dataset:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,57 @@
+"""
+Change versions of each user's data, behind the ETags of food item and user responses.
+
+A version is a random token, with the time it was set, kept in the DataVersion
+table so that every worker and management command sees the same ones. It's
+replaced whenever one of the user's food items, their profile, account or
+groups are written. Responses covering everybody's data go by the latest of
+them, found when they're read, so that writers don't all update a shared row.
+Rows are never deleted: a user without one hasn't changed since the table was
+created and has the initial version.
+"""
+import time
+import uuid
+
+from django.db.models import Q, Subquery
+
+# Scope of responses covering every user's data.
+ALL_USERS = 'all'
+
+INITIAL_VERSION = ('', 0.0)
+
+
+def get_versions(scopes):
+    """
+    {scope: (token, time set)} of user ids or ALL_USERS, read in a single query.
+    """
+    from calorie_app.models import DataVersion
+
+    keys = {str(scope): scope for scope in scopes}
+    condition = Q(scope__in=keys.keys() - {ALL_USERS})
+    if ALL_USERS in keys:
+        latest = DataVersion.objects.order_by('-changed').values('changed')[:1]
+        condition |= Q(changed=Subquery(latest))
+    rows = list(DataVersion.objects.filter(condition).values_list('scope', 'token', 'changed'))
+    found = {scope: (token, changed) for scope, token, changed in rows}
+    if rows:
+        found[ALL_USERS] = max(((token, changed) for _, token, changed in rows), key=lambda version: (version[1], version[0]))
+    return {scope: found.get(key, INITIAL_VERSION) for key, scope in keys.items()}
+
+
+def bump_versions(user_ids):
+    """
+    Replaces the versions of `user_ids`. Inside a transaction, the new versions
+    are seen along with the write they come with, once it commits.
+    """
+    from calorie_app.models import DataVersion
+
+    scopes = {str(user_id) for user_id in user_ids if user_id is not None}
+    if not scopes:
+        return
+    token, changed = uuid.uuid4().hex, time.time()
+    # A single UPDATE once every user has a row, an upsert the first time.
+    if DataVersion.objects.filter(scope__in=scopes).update(token=token, changed=changed) < len(scopes):
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope, token=token, changed=changed) for scope in scopes],
+            update_conflicts=True, unique_fields=['scope'], update_fields=['token', 'changed'],
+        )
@@ -1,54 +1,255 @@
+import hashlib
+import time
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 from django_filters import rest_framework as filters
-from rest_framework import generics, views, viewsets
+from rest_framework import generics, permissions, views, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 
+from calorie_app.export import EXPORT_FORMATS, export_response
+from calorie_app.ingest import create_food_items
 from calorie_app.models import FoodFilter, FoodItem
-from calorie_app.serializers import (FoodItemSerializer, 
+from calorie_app.response_cache import cache_key, detach, list_cache
+from calorie_app.rollups import summarize_daily_totals
+from calorie_app.throttling import LoginIPThrottle, LoginUsernameThrottle
+from calorie_app.serializers import (CalorieSummaryQuerySerializer,
+                                    FoodItemSerializer, 
                                     UserLoginSerializer,
                                     UserRegisterSerializer)
 
 from .permissions import IsOwnerOrAdmin, IsUserManagerOrAdmin
+from calorie_app.versions import ALL_USERS, get_versions
+from calorie_project.routers import read_from_replica, stop_reading_from_replica
+from .roles import ADMINISTRATOR, USER_MANAGER, get_roles, has_role
 from dj_rql.drf.backend import RQLFilterBackend
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+
+class ReplicaReadMixin:
+    """
+    Sends the reads of `replica_actions` to the read replica, unless the data
+    the response covers, told by the views' version_scopes(), changed in the last
+    READ_YOUR_WRITES_SECONDS (see calorie_project.routers).
+    """
+    replica_actions = ('list', 'retrieve')
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None) or request.method.lower()
+        if (settings.READ_REPLICA_ALIAS and request.method in permissions.SAFE_METHODS
+                and action in self.replica_actions
+                and not self.changed_recently(request)):
+            self.replica_token = read_from_replica()
 
-class FoodItemView(viewsets.ModelViewSet):
-    permission_classes = [IsOwnerOrAdmin]
+    def changed_recently(self, request):
+        """
+        Whether the versions of the data the response covers (see ConditionalGetMixin)
+        changed within READ_YOUR_WRITES_SECONDS. The replica may not have the change
+        yet, and its data would be tagged and cached under the new versions until
+        the next write.
+        """
+        if not request.user.is_authenticated:
+            return False
+        versions = self.change_versions = get_versions(self.version_scopes())
+        return max(changed for _, changed in versions.values()) > time.time() - settings.READ_YOUR_WRITES_SECONDS
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = self.__dict__.pop('replica_token', None)
+        if token is not None:
+            stop_reading_from_replica(token)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified on list and retrieve, derived from the change versions
+    of the users the response covers (see calorie_app.versions). A request whose
+    If-None-Match or If-Modified-Since still holds gets a 304 before the queryset
+    or the serializer is touched.
+    """
+
+    def version_scopes(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        versions = self.change_versions = getattr(self, 'change_versions', None) or get_versions(self.version_scopes())
+        # The same versions give a different body for another URL, user, role or format.
+        key = [request.build_absolute_uri(), str(request.user.pk), request.accepted_renderer.format]
+        key += sorted(get_roles(request.user)) + [token for token, _ in versions.values()]
+        etag = quote_etag(hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest())
+        last_modified = int(max(changed for _, changed in versions.values()))
+        # Whole seconds can't tell apart two writes in the second being served,
+        # and data unchanged since versions are kept has no known time.
+        if not last_modified or last_modified >= int(time.time()):
+            last_modified = None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class CachedListMixin:
+    """
+    Serves list responses from calorie_app.response_cache.list_cache when the
+    data they cover hasn't changed since they were cached.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LIST_CACHE_ENABLED or not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        versions = getattr(self, 'change_versions', None) or get_versions(self.version_scopes())
+        key = cache_key(request, versions)
+        data = list_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            list_cache.set(key, detach(response.data))
+        return response
+
+
+class FoodItemView(ReplicaReadMixin, ConditionalGetMixin, CachedListMixin, viewsets.ModelViewSet):
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
     serializer_class = FoodItemSerializer
     filter_backends = (RQLFilterBackend,)
     rql_filter_class = FoodFilter
+    keyset_ordering = ('-timestamp', '-id')
+
     def get_queryset(self):
-        if self.request.user.groups.first().name != "Administrator":
-            return FoodItem.objects.filter(user=self.request.user)
-        return FoodItem.objects.all()
+        queryset = FoodItem.objects.select_related('user')
+        if not has_role(self.request.user, [ADMINISTRATOR]):
+            queryset = queryset.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            # Of the user only the username is serialized.
+            queryset = queryset.only(*[field.name for field in FoodItem._meta.concrete_fields], 'user__username')
+        return queryset
+
+    def version_scopes(self):
+        if has_role(self.request.user, [ADMINISTRATOR]):
+            return [ALL_USERS]
+        return [self.request.user.pk]
+
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Creates a list of food items at once, e.g. from a client syncing an offline log.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({"non_field_errors":["Expected a list of food items."]})
+        if len(request.data) > settings.FOODITEM_BULK_MAX_ITEMS:
+            raise ValidationError({"non_field_errors":[f"At most {settings.FOODITEM_BULK_MAX_ITEMS} food items can be created at once."]})
+        results = create_food_items(request, request.data)
+        created = len([result for result in results if result["status"] == 201])
+        if created == len(results):
+            status = 201
+        elif created:
+            status = 207
+        else:
+            status = 400
+        return Response({"created":created, "results":results}, status=status)
+
+    def export(self, request, *args, **kwargs):
+        """
+        Streams the food items matching the RQL query as CSV, or JSONL with `export_format=jsonl`.
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({"export_format":[f"Expected one of: {', '.join(EXPORT_FORMATS)}."]})
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(queryset, export_format, settings.FOODITEM_EXPORT_CHUNK_SIZE)
 
 
-class UserRegisterView(viewsets.ModelViewSet):
+class UserRegisterView(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     View to create User
     """
     permission_classes = [IsUserManagerOrAdmin]
     # permissions = [IsUserManagerOrAdmin]
     serializer_class = UserRegisterSerializer
+    keyset_ordering = ('id',)
 
     def create(self, request, *args, **kwargs):
-        if request.user.groups.first().name not in ("Administrator", "User_Manager"):
+        if not has_role(request.user, [ADMINISTRATOR, USER_MANAGER]):
             raise PermissionDenied({"message":"You don't have permission to access"}, code=403)
         return super(UserRegisterView, self).create(request, *args, **kwargs)
         
     def get_queryset(self):
-        if self.request.user.groups.first().name not in ("Administrator", "User_Manager"):
-            return User.objects.filter(username=self.request.user.username).filter(is_staff=False)
-        return User.objects.filter(is_staff=False).all()
+        if not has_role(self.request.user, [ADMINISTRATOR, USER_MANAGER]):
+            queryset = User.objects.filter(username=self.request.user.username).filter(is_staff=False)
+        else:
+            queryset = User.objects.filter(is_staff=False).all()
+        queryset = queryset.select_related('profile').prefetch_related('groups')
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.only('id', 'username', 'profile__max_calories', 'profile__timezone')
+        return queryset
+
+    def version_scopes(self):
+        if not has_role(self.request.user, [ADMINISTRATOR, USER_MANAGER]):
+            return [self.request.user.pk]
+        if self.action == 'retrieve':
+            return [self.kwargs['pk']]
+        return [ALL_USERS]
     
 
 class UserLoginView(views.APIView):
+    throttle_classes = [LoginIPThrottle, LoginUsernameThrottle]
+
     def post(self, request):
+        username = request.data.get('username') if isinstance(request.data, dict) else None
+        if request.auth is not None and username == request.user.username:
+            # The client already holds this user's token, hashing the password wouldn't tell more.
+            return Response({"token":request.auth.key}, status=201)
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
         token, _ = Token.objects.get_or_create(user=user)
-        return Response({"token":token.key}, status=201)
\ No newline at end of file
+        return Response({"token":token.key}, status=201)
+
+
+class CalorieSummaryView(ReplicaReadMixin, views.APIView):
+    """
+    Calories per day, week or month of the requesting user, or of any user for admins.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ('get',)
+
+    def version_scopes(self):
+        # The user asked for is only checked in get(), admins may ask for anybody.
+        requested = self.request.query_params.get('user', '')
+        return [self.request.user.pk] + ([int(requested)] if requested.isdigit() else [])
+
+    def get(self, request):
+        query = CalorieSummaryQuerySerializer(data=request.query_params, context={'request':request})
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        user = request.user
+        if data.get('user', user.pk) != user.pk:
+            if not has_role(user, [ADMINISTRATOR]):
+                raise PermissionDenied({"message":"You don't have permission to access"}, code=403)
+            user = get_object_or_404(User.objects.select_related('profile'), pk=data['user'])
+        max_calories = user.profile.max_calories
+        results = summarize_daily_totals(user.pk, data['start'], data['end'], data['period'])
+        return Response({
+            "user":user.username,
+            "period":data['period'],
+            "start":data['start'],
+            "end":data['end'],
+            "max_calories":max_calories,
+            "results":results
+        })
@@ -0,0 +1,264 @@
+"""
+Per-view request metrics, exposed in the Prometheus text format.
+
+MetricsMiddleware times a sample (METRICS_SAMPLE_RATE) of the requests and
+records, per view, the wall time, the number and duration of the database
+queries and the time spent calling external services (see timed_external_call).
+Metrics are kept per process: scrape every worker, or run a single one.
+"""
+import bisect
+import contextvars
+import hmac
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.utils.module_loading import import_string
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Histograms and counters keyed by name and labels.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def define(self, name, kind, help_text, buckets=None):
+        self.metrics[name] = {'kind': kind, 'help': help_text, 'buckets': buckets, 'series': {}}
+
+    def observe(self, name, value, **labels):
+        metric = self.metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = metric['series'].get(key)
+            if series is None:
+                series = metric['series'][key] = Histogram(metric['buckets'])
+            series.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        metric = self.metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            metric['series'][key] = metric['series'].get(key, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            for metric in self.metrics.values():
+                metric['series'] = {}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, metric in self.metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                for key, series in sorted(metric['series'].items()):
+                    labels = dict(key)
+                    if metric['kind'] == 'counter':
+                        lines.append(f"{name}{_labels(labels)} {series}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric['buckets'] + ('+Inf',), series.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(series.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for prefix, path in settings.METRICS_STATS.items():
+            for key, value in import_string(path).stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+registry.define('http_requests_total', 'counter', 'Sampled requests by view, method and status.')
+registry.define('http_request_duration_seconds', 'histogram', 'Wall time of a request.', TIME_BUCKETS)
+registry.define('http_request_db_queries', 'histogram', 'Database queries run by a request.', QUERY_BUCKETS)
+registry.define('http_request_db_seconds', 'histogram', 'Time a request spent in database queries.', TIME_BUCKETS)
+registry.define('http_request_external_seconds', 'histogram', 'Time a request spent calling external services.', TIME_BUCKETS)
+registry.define('external_call_seconds', 'histogram', 'Duration of calls to external services.', TIME_BUCKETS)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.external_seconds = 0.0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def add_external(self, seconds):
+        # Lookups of a bulk upload run on several threads at once.
+        with self._lock:
+            self.external_seconds += seconds
+
+
+# Set for the sampled requests. Async views run their queries on other threads,
+# with connections of their own, but asgiref carries the context over to them.
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+@contextmanager
+def timed_external_call(service):
+    """
+    Times a call to an external service, towards the current request's metrics when it is sampled.
+    """
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('external_call_seconds', elapsed, service=service)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_external(elapsed)
+
+
+def view_name(view_func, method):
+    """
+    `FoodItemView.list` for DRF views and viewsets, the function name otherwise.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    return f"{view_class.__name__}.{actions.get(method.lower(), method.lower())}"
+
+
+class MetricsMiddleware:
+    """
+    Times the sampled requests. Runs as a coroutine in front of async views, so
+    that they're served without a thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # The connections opened before this module was imported missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with self.measure() as metrics:
+            response = self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with self.measure() as metrics:
+            response = await self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    @staticmethod
+    def sampled():
+        return settings.METRICS_ENABLED and random.random() < settings.METRICS_SAMPLE_RATE
+
+    @staticmethod
+    @contextmanager
+    def measure():
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.elapsed = time.perf_counter() - started
+            _current.reset(token)
+
+    @staticmethod
+    def record(request, response, metrics):
+        elapsed = metrics.elapsed
+        view = getattr(request, 'metrics_view', 'unresolved')
+        registry.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        registry.observe('http_request_duration_seconds', elapsed, view=view)
+        registry.observe('http_request_db_queries', metrics.queries, view=view)
+        registry.observe('http_request_db_seconds', metrics.db_seconds, view=view)
+        registry.observe('http_request_external_seconds', metrics.external_seconds, view=view)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_name(view_func, request.method)
+
+
+def metrics_view(request):
+    """
+    The metrics of this process, only served to requests bearing METRICS_TOKEN.
+    Requests reach the app through proxies too, so their address tells nothing.
+    """
+    token = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN or not hmac.compare_digest(
+        token.encode('utf-8'), settings.METRICS_TOKEN.encode('utf-8')
+    ):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
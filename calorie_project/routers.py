@@ -0,0 +1,45 @@
+"""
+Read replica routing.
+
+Views using calorie_app.views.ReplicaReadMixin read from READ_REPLICA_ALIAS
+while serving their safe actions (lists, details, the summary). Everything
+else, writes included, goes to the default database. So do reads of data that
+changed in the last READ_YOUR_WRITES_SECONDS, so that the user who changed it
+sees their change before the replica catches up.
+"""
+import contextvars
+
+from django.conf import settings
+
+_reading_from_replica = contextvars.ContextVar('reading_from_replica', default=False)
+
+
+def read_from_replica():
+    """
+    Sends the reads of the current request to the replica; pass the return value to stop_reading_from_replica().
+    """
+    return _reading_from_replica.set(True)
+
+
+def stop_reading_from_replica(token):
+    _reading_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Versions tell whether a response is still current, they can't lag.
+        if (model._meta.app_label, model._meta.model_name) == ('calorie_app', 'dataversion'):
+            return None
+        if settings.READ_REPLICA_ALIAS and _reading_from_replica.get():
+            return settings.READ_REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the default database.
+        databases = {'default', settings.READ_REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
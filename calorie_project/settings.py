@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.conf import global_settings
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -40,13 +42,14 @@ INSTALLED_APPS = [
 
 
     #self-created or installed apps:
-    'calorie_app',
+    'calorie_app.apps.CalorieAppConfig',
     'rest_framework', 
     'rest_framework.authtoken',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'calorie_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +90,88 @@ DATABASES = {
     }
 }
 
+# Pragmas of the production profile: write-ahead logging, so that readers don't
+# wait for the writer, syncing to disk at checkpoints only (a power loss may drop
+# the last commits, never corrupt the file), a 64 MB page cache per connection,
+# reads through a 256 MB memory map, and temporary tables in memory.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Production profile for SQLite deployments, SQLITE_PRODUCTION=1 in the
+# environment: the SQLITE_PRAGMAS on every connection, writers waiting up to 20
+# seconds for the lock, and connections kept across requests. Transactions start
+# with BEGIN IMMEDIATE and take the write lock up front: a transaction that read
+# first and then tries to write would otherwise fail at once with "database is
+# locked" when another writer got there in between, instead of waiting for it.
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '0') == '1'
+if SQLITE_PRODUCTION:
+    DATABASES['default'].update(
+        OPTIONS={
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+        CONN_MAX_AGE=600,
+        CONN_HEALTH_CHECKS=True,
+    )
+
+# Read replica of the default database, e.g. DATABASE_REPLICA_NAME=replica.sqlite3
+# for a second SQLite file. Lists, details and summaries are read from it, see
+# calorie_project.routers. It mirrors the default database in tests.
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, DATABASE_REPLICA_NAME),
+        TEST={'MIRROR': 'default'},
+    )
+READ_REPLICA_ALIAS = 'replica' if DATABASE_REPLICA_NAME else None
+DATABASE_ROUTERS = ['calorie_project.routers.ReplicaRouter']
+
+# Seconds reads of data that changed stay on the default database, for the
+# replica to catch up. Changes are told by the versions of calorie_app.versions,
+# kept in the database so that a write on any worker counts.
+READ_YOUR_WRITES_SECONDS = 5
+
+
+# Hasher new passwords are stored with: 'pbkdf2', 'argon2' (needs argon2-cffi) or
+# 'bcrypt' (needs bcrypt). Passwords stored with another hasher, or another cost,
+# are rehashed with this one when their user next logs in.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'calorie_app.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'calorie_app.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'calorie_app.hashers.TunedBCryptSHA256PasswordHasher',
+}
+# Django's own hashers follow, so that every password they stored still verifies,
+# bar the ones tuned above: hashers are looked up by algorithm, the last one wins.
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    path for path in global_settings.PASSWORD_HASHERS
+    if not any(tuned.endswith('.Tuned' + path.rsplit('.', 1)[1]) for tuned in _PASSWORD_HASHERS.values())
+]
+
+# Cost of each hasher, at the OWASP recommendations. Every login pays it once,
+# see benchmarks/login.py for what it means in logins per second. PBKDF2 never
+# goes below the iterations of the installed Django, None for just those: logins
+# would otherwise rehash passwords stored with them into weaker hashes.
+PASSWORD_PBKDF2_ITERATIONS = None
+PASSWORD_ARGON2_TIME_COST = 2
+PASSWORD_ARGON2_MEMORY_COST = 19456
+PASSWORD_ARGON2_PARALLELISM = 1
+PASSWORD_BCRYPT_ROUNDS = 10
+
+# Logins allowed per client IP and per username: (burst, seconds to allow it again),
+# None for no limit. Beyond that, /login/ answers 429 without checking the password.
+LOGIN_THROTTLE_IP_RATE = (20, 60)
+LOGIN_THROTTLE_USERNAME_RATE = (5, 60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -128,12 +213,129 @@ STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-        
+        'calorie_app.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 5
-}
\ No newline at end of file
+    'DEFAULT_PAGINATION_CLASS': 'calorie_app.pagination.SelectablePagination',
+    'PAGE_SIZE': 5,
+    # Reverse proxies in front of the app: the client address throttles go by is
+    # taken from X-Forwarded-For only past them, REMOTE_ADDR when there are none.
+    # Clients could send any X-Forwarded-For otherwise.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# The nutrition cache is shared by every worker, run
+# `python manage.py createcachetable` once to create its table.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'nutrition': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'nutrition_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+
+# Nutritionix API used to look up calories of food items posted without them.
+
+NUTRITIONIX_URL = os.environ.get('NUTRITIONIX_URL', 'https://trackapi.nutritionix.com/v2/search/instant')
+NUTRITIONIX_APP_ID = os.environ.get('NUTRITIONIX_APP_ID', 'f26e0228')
+NUTRITIONIX_APP_KEY = os.environ.get('NUTRITIONIX_APP_KEY', '130a3ebf8a86195fe3f8632d6b346c1b')
+
+# Class used to look up calories, e.g. 'calorie_app.providers.FakeNutritionProvider'
+# for tests and staging, built with NUTRITION_PROVIDER_OPTIONS as keyword arguments.
+NUTRITION_PROVIDER = 'calorie_app.providers.NutritionixProvider'
+NUTRITION_PROVIDER_OPTIONS = {
+    'connect_timeout': 1.0,
+    'read_timeout': 2.0,
+    'deadline': 4.0,
+    'retries': 2,
+    'backoff': 0.1,
+    'pool_size': 10,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+}
+
+# Lookups are cached in-process (LRU) and in the `NUTRITION_CACHE_ALIAS` cache.
+# Foods the API doesn't know are cached for `NUTRITION_CACHE_NEGATIVE_TTL` seconds.
+NUTRITION_CACHE_ALIAS = 'nutrition'
+NUTRITION_CACHE_TTL = 60 * 60 * 24
+NUTRITION_CACHE_NEGATIVE_TTL = 60 * 60
+NUTRITION_CACHE_MAX_ENTRIES = 1024
+
+# Concurrent provider lookups made for a bulk upload of food items.
+NUTRITION_LOOKUP_WORKERS = 8
+
+# 'sync' looks up missing calories while the client waits. With 'deferred', foods
+# neither the catalog nor the cache know are stored as pending and enriched later,
+# by NUTRITION_ENRICHMENT_THREADS background threads per process or, with 0 threads,
+# by `python manage.py enrich_fooditems`.
+NUTRITION_ENRICHMENT = 'sync'
+NUTRITION_ENRICHMENT_THREADS = 0
+NUTRITION_ENRICHMENT_MAX_ATTEMPTS = 5
+
+# Serve the food item list and create with a native async view, looking up missing
+# calories without holding a thread. Only useful under ASGI, where asgi.py turns it on.
+ASYNC_FOODITEM_VIEWS = os.environ.get('ASYNC_FOODITEM_VIEWS', '0') == '1'
+
+# Largest list of food items accepted by /fooditem/bulk/.
+FOODITEM_BULK_MAX_ITEMS = 500
+
+# Rows fetched at a time when streaming /fooditem/export/.
+FOODITEM_EXPORT_CHUNK_SIZE = 2000
+
+# Days /summary/ covers when no start is given, and the most it covers at once.
+SUMMARY_DEFAULT_DAYS = 90
+SUMMARY_MAX_DAYS = 366 * 2
+
+# Food item lists are cached in-process, per user (admins share theirs) and query,
+# until a write changes the data they cover; see calorie_app.response_cache.
+LIST_CACHE_ENABLED = True
+LIST_CACHE_MAX_ENTRIES = 1000
+LIST_CACHE_TTL = 60 * 5
+
+# Answer RQL searches on food item names and usernames (like, ilike, search=)
+# from the SearchTrigram table instead of scanning every item, see calorie_app.search.
+# Ignored on PostgreSQL, where pg_trgm indexes serve these lookups directly.
+SEARCH_TRIGRAM_INDEX = True
+
+# Seconds a user's group names are cached across requests in the default cache,
+# 0 to only reuse them within a request. Group changes invalidate the entry in
+# that cache only: with a per-process cache, a demoted admin would keep their
+# rights in the other workers until it expires, so roles are then not cached.
+ROLES_CACHE_TIMEOUT = 0 if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache')) else 60 * 5
+
+# Tokens seen recently are resolved to their user without querying the database,
+# only when AUTH_TOKEN_CACHE_ALIAS names a cache shared by all workers (e.g. Redis
+# or memcached): deactivating a user then takes effect in every worker at once.
+# With a per-process default cache, tokens are looked up on every request.
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10000
+AUTH_TOKEN_CACHE_TTL = 60 * 5
+AUTH_TOKEN_CACHE_ALIAS = None if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache')) else 'default'
+
+# 'offset' pages lists with limit/offset and a total count, 'keyset' with cursors
+# whose cost doesn't grow with the depth of the page. Requests can pick either
+# with `?pagination=offset` or `?pagination=keyset`.
+PAGINATION_MODE = 'offset'
+
+# Per-view request metrics served at /metrics/ in the Prometheus text format,
+# see calorie_project.metrics. METRICS_SAMPLE_RATE is the share of requests timed.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
+# Scrapers send it as `Authorization: Bearer <token>`, /metrics/ isn't served without one.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Objects whose stats() are exported as gauges, by metric name prefix.
+METRICS_STATS = {
+    'nutrition_cache': 'calorie_app.nutrition.lookup_cache',
+    'auth_token_cache': 'calorie_app.authentication.token_cache',
+    'list_cache': 'calorie_app.response_cache.list_cache',
+}
@@ -1,23 +1,118 @@
+import csv
+import importlib
 import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
 from datetime import datetime
+from unittest import mock
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth import get_user_model, models
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
 from django.contrib.contenttypes.models import ContentType
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import include, path, reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 
+import calorie_app.enrichment as enrichment
+import calorie_app.providers as providers
 import calorie_app.views as apiviews
+from calorie_app.async_views import fooditem_list as async_fooditem_list
 from calorie_app.serializers import UserRegisterSerializer, ProfileSerializer
-from calorie_app.models import FoodItem, UserProfile
+from calorie_app.models import DailyCalorieTotal, DataVersion, FoodCatalog, FoodFilter, FoodItem, SearchTrigram, UserProfile
+from calorie_app.nutrition import lookup_cache, lookup_calories
+from calorie_app.authentication import token_cache
+from calorie_app.response_cache import list_cache, normalize_query
+from calorie_app.roles import get_roles
+from calorie_app.rollups import refresh_calories_exceeded, refresh_daily_total
+from calorie_app.versions import ALL_USERS, bump_versions
+from calorie_app.providers import (CircuitBreaker, NutritionixProvider,
+                                   ProviderUnavailable, get_provider)
+import calorie_project.settings as project_settings
+from calorie_project.metrics import MetricsMiddleware, registry as metrics_registry
+from calorie_project.routers import ReplicaRouter
+
+
+class StubNutritionixHandler(BaseHTTPRequestHandler):
+    """
+    Answers /v2/search/instant like Nutritionix does, from a fixed set of foods.
+    """
+    foods = {
+        "chicken burger": 520,
+        "banana": 105,
+        "apple pie": 296,
+    }
+    queries = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('query', [''])[0]
+        StubNutritionixHandler.queries.append(query)
+        branded = []
+        if query.lower() in self.foods:
+            branded.append({"food_name": query, "nf_calories": self.foods[query.lower()]})
+        body = json.dumps({"common": [], "branded": branded}).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubNutritionixMixin:
+    """
+    Points the app at a local stub of the Nutritionix API for the whole test case.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.stub_server = HTTPServer(('127.0.0.1', 0), StubNutritionixHandler)
+        threading.Thread(target=cls.stub_server.serve_forever, daemon=True).start()
+        cls.stub_settings = override_settings(
+            NUTRITIONIX_URL=f'http://127.0.0.1:{cls.stub_server.server_port}/v2/search/instant'
+        )
+        cls.stub_settings.enable()
+        super().setUpClass()
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.stub_settings.disable()
+        cls.stub_server.shutdown()
+        cls.stub_server.server_close()
 
-class TestingAPI(APITestCase):
+    def setUp(self):
+        StubNutritionixHandler.queries = []
+        lookup_cache.clear()
+        super().setUp()
+
+
+class TestingAPI(StubNutritionixMixin, APITestCase):
     urlpatterns = [
         path('', include('calorie_app.urls')),
     ]
     def setUp(self):
+        super().setUp()
+        #login throttles and cached roles and versions would carry over from other tests
+        cache.clear()
         self.client = APIClient()
         self.factory = APIRequestFactory()
         self.view = apiviews.UserRegisterView.as_view({'get':'list'})
@@ -40,6 +135,21 @@ class TestingAPI(APITestCase):
         self.user3 = self.setup_user('user3', 'user3', 'Normal_User', 2100)
         self.token3 = TestingAPI.token_creation(self.user3)
 
+    def assertConstantQueries(self, url, token, page_sizes=(1, 5, 20)):
+        """
+        Fails when listing `url` takes more queries for a bigger page.
+        """
+        #the first request warms the token and roles caches
+        self.client.get(url, HTTP_AUTHORIZATION = f'token {token.key}')
+        counts = []
+        for limit in page_sizes:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"limit":limit}, HTTP_AUTHORIZATION = f'token {token.key}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), min(limit, response.data["count"]))
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, f'Queries per page size {dict(zip(page_sizes, counts))}: {[query["sql"] for query in queries.captured_queries]}')
+
     @staticmethod
     def token_creation(user):
         token = Token.objects.create(user=user)
@@ -181,6 +291,53 @@ class TestingAPI(APITestCase):
             if(test_cases[i]["status_code"]) == 201:
                 self.assertEqual(response.data["token"], test_cases[i]["token"])
                          
+    def test_login_rehash_and_throttling(self):
+        User = get_user_model()
+        hasher = PBKDF2PasswordHasher()
+        User.objects.create(username='fewer_iterations', password=hasher.encode('secret', hasher.salt(), iterations=1000))
+        User.objects.create(username='old_hasher', password=make_password('secret', hasher='pbkdf2_sha1'))
+        User.objects.create(username='scrypt', password=make_password('secret', hasher='scrypt'))
+        #a setting below Django's iterations doesn't weaken the hashes logins store
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            User.objects.create(username='too_few_iterations', password=make_password('secret'))
+        for username in ('fewer_iterations', 'old_hasher', 'scrypt', 'too_few_iterations'):
+            response = self.client.post(reverse('login'), {"username":username, "password":"secret"}, REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 201)
+            algorithm, iterations = User.objects.get(username=username).password.split('$')[:2]
+            self.assertEqual((algorithm, int(iterations)), ('pbkdf2_sha256', PBKDF2PasswordHasher.iterations), username)
+
+        #a client holding the user's token gets it back without the password being hashed
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.verify') as verify:
+            response = self.client.post(reverse('login'), {"username":"user3", "password":"wrong"}, HTTP_AUTHORIZATION=f'token {self.token3.key}')
+        self.assertEqual((response.status_code, response.data["token"]), (201, self.token3.key))
+        verify.assert_not_called()
+
+        test_cases = [
+            ({"LOGIN_THROTTLE_USERNAME_RATE":(2, 60)}, [("10.0.0.2", "user1"), ("10.0.0.3", "user1"), ("10.0.0.4", "user1")], [400, 400, 429]),
+            ({"LOGIN_THROTTLE_IP_RATE":(2, 60)}, [("10.0.0.5", "nobody1"), ("10.0.0.5", "nobody2"), ("10.0.0.5", "nobody3")], [400, 400, 429]),
+            ({"LOGIN_THROTTLE_IP_RATE":None, "LOGIN_THROTTLE_USERNAME_RATE":None}, [("10.0.0.6", "user2")] * 6, [400] * 6),
+        ]
+        for rates, attempts, expected_codes in test_cases:
+            with override_settings(**rates):
+                responses = [
+                    self.client.post(reverse('login'), {"username":username, "password":"wrong"}, REMOTE_ADDR=address)
+                    for address, username in attempts
+                ]
+            self.assertEqual([response.status_code for response in responses], expected_codes, rates)
+            if expected_codes[-1] == 429:
+                self.assertIn('Retry-After', responses[-1])
+        #X-Forwarded-For is only trusted past the configured proxies
+        for num_proxies, expected_codes in ((0, [400, 400, 429]), (1, [400, 400, 400])):
+            with override_settings(LOGIN_THROTTLE_IP_RATE=(2, 60), REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES":num_proxies}):
+                responses = [
+                    self.client.post(reverse('login'), {"username":f"nobody{address}", "password":"wrong"},
+                                     REMOTE_ADDR=f'10.0.1.{num_proxies}', HTTP_X_FORWARDED_FOR=f'192.0.2.{address}')
+                    for address in range(3)
+                ]
+            self.assertEqual([response.status_code for response in responses], expected_codes, num_proxies)
+        response = self.client.post(reverse('login'), {"username":"user2", "password":"user2"}, REMOTE_ADDR='10.0.0.7')
+        self.assertEqual(response.status_code, 201)
+
     def test_get_user_details(self):
         test_cases = [
             {
@@ -760,3 +917,1010 @@ class TestingAPI(APITestCase):
         )
         items = FoodItem.objects.filter(user__username='user2').filter(food_item__icontains='Rice')
         self.assertEqual(response.data['count'], items.count())
+
+    def test_calorie_lookup_cache(self):
+        test_cases = [
+            {
+                "name":"first_lookup_goes_upstream",
+                "food_item":"Banana",
+                "expected_code":201,
+                "expected_queries":["banana"],
+            }, {
+                "name":"normalized_repeat_is_cached",
+                "food_item":"  BANANA ",
+                "expected_code":201,
+                "expected_queries":["banana"],
+            }, {
+                "name":"unknown_item_goes_upstream",
+                "food_item":"asdasdasd",
+                "expected_code":400,
+                "expected_queries":["banana", "asdasdasd"],
+            }, {
+                "name":"unknown_item_is_negatively_cached",
+                "food_item":"asdasdasd",
+                "expected_code":400,
+                "expected_queries":["banana", "asdasdasd"],
+            }
+        ]
+        for i in range(len(test_cases)):
+            response = self.client.post(
+                reverse('fooditem'),
+                {"food_item":test_cases[i]["food_item"]},
+                HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+            self.assertEqual(response.status_code, test_cases[i]["expected_code"], f'Expected Response Code {test_cases[i]["expected_code"]}, received {response.status_code} instead.')
+            self.assertEqual(StubNutritionixHandler.queries, test_cases[i]["expected_queries"])
+            if response.status_code == 201:
+                self.assertEqual(response.data["num_of_calories"], 105)
+        self.assertEqual(lookup_cache.stats()["misses"], 2)
+        self.assertEqual(lookup_cache.stats()["local_hits"], 2)
+
+        #a fresh worker process still finds the entries in the shared cache
+        lookup_cache.local.clear()
+        response = self.client.post(
+            reverse('fooditem'),
+            {"food_item":"banana"},
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(lookup_cache.stats()["shared_hits"], 1)
+        self.assertEqual(len(StubNutritionixHandler.queries), 2)
+
+        #a shared cache that can't be read or written, e.g. a missing table, falls back to the provider
+        with mock.patch.object(DatabaseCache, 'get', side_effect=DatabaseError("no such table")), \
+             mock.patch.object(DatabaseCache, 'set', side_effect=DatabaseError("no such table")):
+            response = self.client.post(
+                reverse('fooditem'),
+                {"food_item":"Chicken burger"},
+                HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["num_of_calories"], 520)
+        self.assertEqual(StubNutritionixHandler.queries[-1], "chicken burger")
+
+    @override_settings(NUTRITIONIX_URL='http://127.0.0.1:1/v2/search/instant')
+    def test_add_fooditem_provider_down(self):
+        response = self.client.post(
+            reverse('fooditem'),
+            {"food_item":"Banana"},
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 503, f'Expected Response Code 503, received {response.status_code} instead.')
+        #items posted with their calories don't need the provider
+        response = self.client.post(
+            reverse('fooditem'),
+            {"food_item":"Banana", "num_of_calories":105},
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 201, f'Expected Response Code 201, received {response.status_code} instead.')
+
+
+    def test_async_fooditem_view(self):
+        factory = RequestFactory()
+        request = factory.post(
+            '/fooditem/', {"food_item":"Banana"}, HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        response = async_to_sync(async_fooditem_list)(request)
+        self.assertEqual(response.status_code, 201, f'Expected Response Code 201, received {response.status_code} instead.')
+        self.assertEqual(json.loads(response.content)["num_of_calories"], 105)
+        #looked up once by the async client, the serializer then hits the cache
+        self.assertEqual(StubNutritionixHandler.queries, ["banana"])
+
+        request = factory.get('/fooditem/', HTTP_AUTHORIZATION = f'token {self.token3.key}')
+        response = async_to_sync(async_fooditem_list)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["count"], 1)
+
+        with override_settings(NUTRITIONIX_URL='http://127.0.0.1:1/v2/search/instant'):
+            request = factory.post(
+                '/fooditem/', {"food_item":"Apple"}, HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+            response = async_to_sync(async_fooditem_list)(request)
+        self.assertEqual(response.status_code, 503, f'Expected Response Code 503, received {response.status_code} instead.')
+
+    def test_daily_calorie_totals(self):
+        def today_total(user):
+            row = DailyCalorieTotal.objects.filter(user=user, date=timezone.localdate()).first()
+            return (row.total, row.count) if row else None
+
+        items = []
+        for payload in ({"food_item":"Fried rice", "num_of_calories":450}, {"food_item":"Banana"}):
+            response = self.client.post(
+                reverse('fooditem'),
+                payload,
+                HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+            items.append(response.data['id'])
+        self.assertEqual(today_total(self.user3), (555, 2))
+
+        response = self.client.patch(
+            reverse('food-details', kwargs={'pk':items[0]}),
+            {"num_of_calories":300},
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(today_total(self.user3), (405, 2))
+
+        response = self.client.delete(
+            reverse('food-details', kwargs={'pk':items[1]}),
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(today_total(self.user3), (300, 1))
+        self.assertEqual(today_total(self.user1), None)
+
+        #the rebuild command repairs totals that drifted
+        DailyCalorieTotal.objects.filter(user=self.user3).update(total=1, count=7)
+        DailyCalorieTotal.objects.create(user=self.user1, date=timezone.localdate(), total=10, count=1)
+        call_command('rebuild_daily_totals', stdout=StringIO())
+        self.assertEqual(today_total(self.user3), (300, 1))
+        self.assertEqual(today_total(self.user1), None)
+
+    def test_bulk_deletes(self):
+        def delete_queries(queryset_or_user):
+            with CaptureQueriesContext(connection) as queries:
+                queryset_or_user.delete()
+            return len(queries)
+
+        #user3's limit is 2100, crossed by the 22nd item
+        FoodItem.objects.bulk_create(FoodItem(user=self.user3, food_item=f"item {i}", num_of_calories=100) for i in range(30))
+        FoodItem.objects.bulk_create(FoodItem(user=self.user2, food_item=f"item {i}", num_of_calories=100) for i in range(30))
+        for user in (self.user3, self.user2):
+            refresh_daily_total(user.pk, timezone.localdate())
+            refresh_calories_exceeded(user.pk, timezone.localdate())
+        self.assertEqual(FoodItem.objects.filter(user=self.user3, calories_exceeded=True).count(), 9)
+
+        #each day is updated once, however many of its items go
+        few = delete_queries(FoodItem.objects.filter(user=self.user3, food_item__in=["item 0", "item 1"]))
+        many = delete_queries(FoodItem.objects.filter(user=self.user3, food_item__in=[f"item {i}" for i in range(2, 15)]))
+        self.assertEqual(few, many)
+        total = DailyCalorieTotal.objects.get(user=self.user3, date=timezone.localdate())
+        self.assertEqual((total.total, total.count), (1500, 15))
+        self.assertFalse(FoodItem.objects.filter(user=self.user3, calories_exceeded=True).exists())
+
+        #an item moved to another day without its fields loaded leaves the old day too
+        from datetime import timedelta
+        yesterday = timezone.localdate() - timedelta(days=1)
+        item = FoodItem.objects.only('id').get(user=self.user3, food_item="item 15")
+        item.local_date = yesterday
+        item.save()
+        totals = DailyCalorieTotal.objects.filter(user=self.user3).order_by('date').values_list('total', 'count')
+        self.assertEqual(list(totals), [(100, 1), (1400, 14)])
+
+        #a deleted user's items don't update totals that go along with them
+        self.assertLess(delete_queries(self.user2), 30)
+        self.assertFalse(DailyCalorieTotal.objects.filter(user_id=self.user2.pk).exists())
+
+    def test_calorie_summary(self):
+        from datetime import date
+        for day, total, count in ((date(2026, 3, 2), 2500, 3), (date(2026, 3, 4), 1200, 2), (date(2026, 4, 1), 2200, 1)):
+            DailyCalorieTotal.objects.create(user=self.user3, date=day, total=total, count=count, max_calories=2100)
+        test_cases = [
+            ({"start":"2026-03-01", "end":"2026-04-30"}, [("2026-03-02", 2500, 3, 1), ("2026-03-04", 1200, 2, 0), ("2026-04-01", 2200, 1, 1)]),
+            ({"start":"2026-03-01", "end":"2026-04-30", "period":"week"}, [("2026-03-02", 3700, 5, 1), ("2026-03-30", 2200, 1, 1)]),
+            ({"start":"2026-03-01", "end":"2026-04-30", "period":"month"}, [("2026-03-01", 3700, 5, 1), ("2026-04-01", 2200, 1, 1)]),
+            ({"start":"2026-03-03", "end":"2026-03-31"}, [("2026-03-04", 1200, 2, 0)]),
+        ]
+        for params, expected in test_cases:
+            response = self.client.get(reverse('summary'), params, HTTP_AUTHORIZATION = f'token {self.token3.key}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [(str(row["start"]), row["calories"], row["items"], row["exceeded_days"]) for row in response.data["results"]],
+                expected
+            )
+
+        #admins can read anybody's summary, other users only their own
+        test_cases = [
+            (self.token1, {"user":self.user3.pk}, 200),
+            (self.token3, {"user":self.user1.pk}, 403),
+            (self.token1, {"user":0}, 404),
+            (self.token3, {"start":"2026-04-01", "end":"2026-03-01"}, 400),
+            (self.token3, {"period":"year"}, 400),
+        ]
+        for token, params, expected_status in test_cases:
+            response = self.client.get(reverse('summary'), params, HTTP_AUTHORIZATION = f'token {token.key}')
+            self.assertEqual(response.status_code, expected_status, f'Expected Response Code {expected_status}, received {response.status_code} instead.')
+        response = self.client.get(reverse('summary'), {"user":self.user3.pk, "start":"2026-03-01"}, HTTP_AUTHORIZATION = f'token {self.token1.key}')
+        self.assertEqual(response.data["user"], "user3")
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_bulk_import_users(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as dataset:
+            dataset.write(
+                "username,password,group,max_calories,timezone\n"
+                "alice,alice-pass,User_Manager,1800,Europe/Paris\n"
+                "bob,bob-pass,,,\n"
+                "alice,again,,,\n"
+                "user3,taken,,,\n"
+                "carol,carol-pass,Chefs,,\n"
+                "dave,dave-pass,,lots,\n"
+                ",no-name,,,\n"
+            )
+        self.addCleanup(os.remove, dataset.name)
+        etag = self.client.get(reverse('users'), HTTP_AUTHORIZATION=f'token {self.token1.key}')['ETag']
+        out = StringIO()
+        call_command('bulk_import_users', dataset.name, '--workers', '2', '--batch-size', '1', stdout=out)
+        self.assertIn("Imported 2 users", out.getvalue())
+        self.assertIn("skipped 5 records", out.getvalue())
+        response = self.client.get(reverse('users'), HTTP_AUTHORIZATION=f'token {self.token1.key}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        alice = get_user_model().objects.get(username="alice")
+        self.assertTrue(alice.check_password("alice-pass"))
+        self.assertEqual(list(alice.groups.values_list('name', flat=True)), ["User_Manager"])
+        self.assertEqual((alice.profile.max_calories, alice.profile.timezone), (1800, "Europe/Paris"))
+        bob = get_user_model().objects.get(username="bob")
+        self.assertEqual(list(bob.groups.values_list('name', flat=True)), ["Normal_User"])
+        self.assertEqual(bob.profile.max_calories, 2000)
+
+        #imported users can log in right away
+        response = self.client.post(reverse('login'), {"username":"bob", "password":"bob-pass"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_export_fooditems(self):
+        for user, food_item, calories in ((self.user3, "Banana", 105), (self.user3, "Fried rice", 450), (self.user1, "Apple", 95)):
+            FoodItem.objects.create(user=user, food_item=food_item, num_of_calories=calories)
+        test_cases = [
+            (self.token3, "", 200, ["Banana", "Fried rice"]),
+            (self.token1, "", 200, ["Banana", "Fried rice", "Apple"]),
+            (self.token1, "consumer=user3&item=Banana", 200, ["Banana"]),
+            (self.token3, "export_format=jsonl", 200, ["Banana", "Fried rice"]),
+            (self.token3, "export_format=xml", 400, None),
+            (None, "", 401, None),
+        ]
+        for token, query, expected_status, expected_items in test_cases:
+            auth = {"HTTP_AUTHORIZATION": f'token {token.key}'} if token else {}
+            response = self.client.get(f"{reverse('fooditem-export')}?{query}", **auth)
+            self.assertEqual(response.status_code, expected_status, f'Expected Response Code {expected_status}, received {response.status_code} instead.')
+            if expected_items is None:
+                continue
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content).decode('utf-8')
+            if "jsonl" in query:
+                rows = [json.loads(line) for line in content.splitlines()]
+            else:
+                rows = list(csv.DictReader(StringIO(content)))
+            self.assertEqual([row["food_item"] for row in rows], expected_items, query)
+        self.assertEqual(rows[0]["user"], "user3")
+        self.assertEqual(int(rows[0]["num_of_calories"]), 105)
+
+        out = StringIO()
+        call_command('export_fooditems', '--format', 'jsonl', '--username', 'user1', stdout=out)
+        self.assertEqual([json.loads(line)["food_item"] for line in out.getvalue().splitlines()], ["Apple"])
+
+    def test_search_index(self):
+        for user, food_item in ((self.user3, "Fried Rice"), (self.user3, "Rice pudding"), (self.user1, "Apple pie"), (self.user2, "Ricotta")):
+            FoodItem.objects.create(user=user, food_item=food_item, num_of_calories=100)
+        renamed = FoodItem.objects.create(user=self.user1, food_item="Soup", num_of_calories=100)
+        renamed.food_item = "Brown rice"
+        renamed.save()
+        test_cases = [
+            (self.token1, "like(item,*rice*)", ["Fried Rice", "Rice pudding", "Brown rice"]),
+            (self.token1, "ilike(item,RICE*)", ["Rice pudding"]),
+            (self.token1, "like(item,*ie)", ["Apple pie"]),
+            (self.token1, "ilike(consumer,*ER3)", ["Fried Rice", "Rice pudding"]),
+            (self.token1, "ilike(item,*ric*)", ["Fried Rice", "Rice pudding", "Ricotta", "Brown rice"]),
+            (self.token1, "ne(item,Ricotta)&like(item,*ri*)", ["Fried Rice", "Rice pudding", "Brown rice"]),
+            (self.token1, "like(item,*soup*)", []),
+            (self.token3, "like(item,*rice*)", ["Fried Rice", "Rice pudding"]),
+        ]
+        for token, query, expected_items in test_cases:
+            response = self.client.get(f"{reverse('fooditem')}?{query}&limit=20", HTTP_AUTHORIZATION = f'token {token.key}')
+            self.assertEqual(response.status_code, 200, query)
+            self.assertCountEqual([item["food_item"] for item in response.data["results"]], expected_items, query)
+
+        with override_settings(SEARCH_TRIGRAM_INDEX=False):
+            response = self.client.get(f"{reverse('fooditem')}?ilike(item,*ric*)", HTTP_AUTHORIZATION = f'token {self.token1.key}')
+        self.assertEqual(response.data["count"], 4)
+
+        SearchTrigram.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertFalse(SearchTrigram.objects.filter(value="Soup").exists())
+        response = self.client.get(f"{reverse('fooditem')}?ilike(consumer,user*)&like(item,*rice*)", HTTP_AUTHORIZATION = f'token {self.token1.key}')
+        self.assertEqual(response.data["count"], 3)
+
+        #a name already indexed costs a single lookup
+        with CaptureQueriesContext(connection) as queries:
+            FoodItem.objects.create(user=self.user2, food_item="Fried Rice", num_of_calories=100)
+        self.assertEqual(len([query for query in queries.captured_queries if 'searchtrigram' in query['sql']]), 1)
+
+    def test_conditional_get(self):
+        FoodItem.objects.create(user=self.user3, food_item="Banana", num_of_calories=105)
+        auth3 = f'token {self.token3.key}'
+        auth1 = f'token {self.token1.key}'
+        response = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth3)
+        etag = response['ETag']
+        #only the token, the user's groups and the versions are read
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth3, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        admin_etag = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth1)['ETag']
+        self.assertNotEqual(admin_etag, etag)
+        self.assertNotEqual(self.client.get(f"{reverse('fooditem')}?item=Banana", HTTP_AUTHORIZATION=auth3)['ETag'], etag)
+
+        test_cases = [
+            #another user's write only changes what admins see
+            (lambda: FoodItem.objects.create(user=self.user2, food_item="Apple", num_of_calories=95), 304, 200),
+            (lambda: self.client.post(reverse('fooditem'), {"food_item":"Rice", "num_of_calories":200}, HTTP_AUTHORIZATION=auth3), 200, 200),
+            (lambda: FoodItem.objects.filter(user=self.user3).first().delete(), 200, 200),
+            (lambda: self.client.patch(reverse('user-details', args=[self.user3.pk]), {"profile":{"max_calories":100}}, format='json', HTTP_AUTHORIZATION=auth1), 200, 200),
+            (lambda: self.client.post(reverse('login'), {"username":"user3", "password":"user3"}), 304, 304),
+        ]
+        for write, expected_user, expected_admin in test_cases:
+            etag = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth3)['ETag']
+            admin_etag = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth1)['ETag']
+            write()
+            self.assertEqual(self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth3, HTTP_IF_NONE_MATCH=etag).status_code, expected_user)
+            self.assertEqual(self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=auth1, HTTP_IF_NONE_MATCH=admin_etag).status_code, expected_admin)
+        #admins' version is the latest user's, writers don't share a row
+        self.assertFalse(DataVersion.objects.filter(scope=ALL_USERS).exists())
+        with self.assertNumQueries(1):
+            bump_versions([self.user2.pk])
+
+        url = reverse('user-details', args=[self.user3.pk])
+        with mock.patch('calorie_app.views.time.time', return_value=timezone.now().timestamp() + 5):
+            response = self.client.get(url, HTTP_AUTHORIZATION=auth1)
+            self.assertIn('Last-Modified', response)
+            response = self.client.get(url, HTTP_AUTHORIZATION=auth1, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+        etag = self.client.get(url, HTTP_AUTHORIZATION=auth1)['ETag']
+        self.client.patch(url, {"profile":{"timezone":"Asia/Kolkata"}}, format='json', HTTP_AUTHORIZATION=auth1)
+        response = self.client.get(url, HTTP_AUTHORIZATION=auth1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["profile"]["timezone"], "Asia/Kolkata")
+
+    def test_list_cache(self):
+        FoodItem.objects.create(user=self.user3, food_item="Fried rice", num_of_calories=450)
+        auth3 = f'token {self.token3.key}'
+        auth1 = f'token {self.token1.key}'
+        list_cache.clear()
+        url = f"{reverse('fooditem')}?like(item,*rice*)&limit=5"
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=auth3).data["count"], 1)
+        self.client.get(url, HTTP_AUTHORIZATION=auth1)
+        #the token, the user's groups and the versions
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{reverse('fooditem')}?limit=5&like(item,%2Arice%2A)", HTTP_AUTHORIZATION=auth3)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(list_cache.stats()["hits"], 1)
+
+        test_cases = [
+            #an admin's own write leaves the user's entry alone
+            (lambda: FoodItem.objects.create(user=self.user1, food_item="Brown rice", num_of_calories=300), 1, 2, True),
+            (lambda: FoodItem.objects.create(user=self.user3, food_item="Rice pudding", num_of_calories=300), 2, 3, False),
+        ]
+        for write, expected_user, expected_admin, user_cached in test_cases:
+            write()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_AUTHORIZATION=auth3)
+            self.assertEqual(response.data["count"], expected_user)
+            self.assertEqual(len(queries) == 3, user_cached)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=auth1).data["count"], expected_admin)
+
+        with override_settings(LIST_CACHE_ENABLED=False):
+            size = len(list_cache)
+            self.client.get(f"{reverse('fooditem')}?limit=7", HTTP_AUTHORIZATION=auth3)
+            self.assertEqual(len(list_cache), size)
+        self.assertIn('list_cache_hits', metrics_registry.render())
+        self.assertEqual(normalize_query("limit=5&(eq(item,a)|eq(item,b))&ge(day,2021-01-01)"), "(eq(item,a)|eq(item,b))&ge(day,2021-01-01)&limit=5")
+
+    def test_replica_routing(self):
+        FoodItem.objects.create(user=self.user3, food_item="Banana", num_of_calories=105)
+        #versions that last changed a while ago, long enough for the replica to catch up
+        DataVersion.objects.update(changed=time.time() - 60)
+        routed = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            routed.append((model._meta.model_name, alias))
+            return alias
+
+        test_cases = [
+            ("get", reverse('fooditem'), self.token3, "fooditem", "default"),
+            ("get", reverse('summary'), self.token3, "dailycalorietotal", "default"),
+            ("get", reverse('user-details', args=[self.user3.pk]), self.token1, "user", "default"),
+            #after a write, the user reads from the primary for a while
+            ("post", reverse('fooditem'), self.token3, "fooditem", None),
+            ("get", reverse('fooditem'), self.token3, "fooditem", None),
+            ("get", reverse('summary'), self.token3, "dailycalorietotal", None),
+            ("get", f"{reverse('summary')}?user={self.user3.pk}", self.token1, "dailycalorietotal", None),
+            ("get", reverse('summary'), self.token1, "dailycalorietotal", "default"),
+            #and data changed that recently isn't read from the replica by anybody
+            ("get", reverse('fooditem'), self.token1, "fooditem", None),
+            ("get", reverse('users'), self.token1, "user", None),
+            ("get", reverse('user-details', args=[self.user2.pk]), self.token1, "user", "default"),
+        ]
+        #'default' stands in for the replica: the router is the same, there's only one test database
+        with override_settings(READ_REPLICA_ALIAS='default'), mock.patch.object(ReplicaRouter, 'db_for_read', record):
+            for method, url, token, model_name, expected_alias in test_cases:
+                #each request is served by another worker, with caches of its own
+                list_cache.clear()
+                cache.clear()
+                routed.clear()
+                response = getattr(self.client, method)(url, {"food_item":"Rice", "num_of_calories":200} if method == "post" else None, HTTP_AUTHORIZATION=f'token {token.key}')
+                self.assertLess(response.status_code, 300, url)
+                self.assertEqual({alias for name, alias in routed if name == model_name}, {expected_alias}, (method, url))
+
+    def test_list_queries_independent_of_page_size(self):
+        for i in range(10):
+            for user in (self.user1, self.user3):
+                FoodItem.objects.create(user=user, food_item=f"item {i}", num_of_calories=10)
+            self.setup_user(f'imported{i}', f'imported{i}', "Normal_User", 2000)
+        self.assertConstantQueries(reverse('fooditem'), self.token1)
+        self.assertConstantQueries(reverse('fooditem'), self.token3)
+        self.assertConstantQueries(reverse('users'), self.token1)
+
+    def test_user_time_zone(self):
+        from datetime import datetime, timezone as dt_timezone
+        self.user3.profile.timezone = 'America/New_York'
+        self.user3.profile.save()
+        #21:00 on the 1st in New York is already the 2nd in Kolkata
+        logged_at = datetime(2026, 3, 2, 2, 0, tzinfo=dt_timezone.utc)
+        item = FoodItem.objects.create(user=self.user3, food_item="Banana", num_of_calories=105, timestamp=logged_at)
+        self.assertEqual(str(item.local_date), "2026-03-01")
+        self.assertEqual(str(FoodItem.objects.create(user=self.user1, food_item="Banana", num_of_calories=105, timestamp=logged_at).local_date), "2026-03-02")
+        self.assertEqual(DailyCalorieTotal.objects.get(user=self.user3).date.isoformat(), "2026-03-01")
+
+        test_cases = [
+            ("day=2026-03-01", 1),
+            ("day=2026-03-02", 0),
+            ("and(ge(day,2026-02-01),lt(day,2026-03-02))", 1),
+        ]
+        for query, expected_count in test_cases:
+            response = self.client.get(f"{reverse('fooditem')}?{query}", HTTP_AUTHORIZATION = f'token {self.token3.key}')
+            self.assertEqual(response.data["count"], expected_count, query)
+
+        test_cases = [
+            ({"timezone":"Europe/Paris"}, 200),
+            ({"timezone":"Mars/Olympus_Mons"}, 400),
+        ]
+        for profile, expected_status in test_cases:
+            response = self.client.patch(
+                reverse('user-details', kwargs={'pk':self.user3.pk}),
+                {"profile":profile}, format="json",
+                HTTP_AUTHORIZATION = f'token {self.token1.key}'
+            )
+            self.assertEqual(response.status_code, expected_status, f'Expected Response Code {expected_status}, received {response.status_code} instead.')
+        self.assertEqual(UserProfile.objects.get(user=self.user3).timezone, "Europe/Paris")
+
+    def test_calories_exceeded_recomputed(self):
+        def flags():
+            return list(FoodItem.objects.filter(user=self.user3).order_by('id').values_list('calories_exceeded', flat=True))
+
+        items = []
+        for payload, expected in (
+            ({"food_item":"Fried rice", "num_of_calories":1500}, False),
+            ({"food_item":"Banana"}, False),
+            #user3's limit is 2100, the item crossing it is flagged too
+            ({"food_item":"Chicken burger"}, True),
+        ):
+            response = self.client.post(reverse('fooditem'), payload, HTTP_AUTHORIZATION = f'token {self.token3.key}')
+            self.assertEqual(response.data['calories_exceeded'], expected)
+            items.append(response.data['id'])
+
+        test_cases = [
+            (self.client.patch, items[0], {"num_of_calories":1000}, [False, False, False]),
+            (self.client.patch, items[0], {"num_of_calories":1500}, [False, False, True]),
+            (self.client.delete, items[1], {}, [False, False]),
+        ]
+        for method, pk, payload, expected in test_cases:
+            response = method(
+                reverse('food-details', kwargs={'pk':pk}), payload, HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+            self.assertIn(response.status_code, (200, 204))
+            self.assertEqual(flags(), expected)
+
+        #a new limit re-flags the day
+        response = self.client.patch(
+            reverse('user-details', kwargs={'pk':self.user3.pk}),
+            {"profile":{"max_calories":1400}}, format="json",
+            HTTP_AUTHORIZATION = f'token {self.token1.key}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(flags(), [True, True])
+        self.assertEqual(DailyCalorieTotal.objects.get(user=self.user3).total, 2020)
+
+        #past days keep the limit they were logged under, for their flags and in the summary alike
+        from datetime import timedelta
+        yesterday = timezone.localdate() - timedelta(days=1)
+        past = [FoodItem.objects.create(user=self.user3, food_item=f"Biryani {i}", num_of_calories=800, timestamp=timezone.now() - timedelta(days=1)) for i in range(2)]
+        DailyCalorieTotal.objects.filter(user=self.user3, date=yesterday).update(max_calories=1500)
+        FoodItem.objects.get(pk=past[1].pk).save()
+        for max_calories in (3000, 1000):
+            response = self.client.patch(
+                reverse('user-details', kwargs={'pk':self.user3.pk}),
+                {"profile":{"max_calories":max_calories}}, format="json",
+                HTTP_AUTHORIZATION = f'token {self.token1.key}'
+            )
+            self.assertEqual(response.status_code, 200)
+            #an edit re-flags the past day with its own limit
+            item = FoodItem.objects.get(pk=past[0].pk)
+            item.num_of_calories = 750
+            item.save()
+            past_flags = list(FoodItem.objects.filter(pk__in=[item.pk for item in past]).order_by('id').values_list('calories_exceeded', flat=True))
+            self.assertEqual(past_flags, [False, True], max_calories)
+            response = self.client.get(reverse('summary'), HTTP_AUTHORIZATION = f'token {self.token3.key}')
+            exceeded = {str(row["start"]): row["exceeded_days"] for row in response.data["results"]}
+            self.assertEqual(exceeded, {str(yesterday): 1, str(timezone.localdate()): int(max_calories < 2020)}, max_calories)
+            self.assertEqual(flags()[:2], [max_calories < 1500, max_calories < 2020])
+
+
+    def test_roles_resolved_once(self):
+        def group_queries(url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_AUTHORIZATION = f'token {self.token2.key}')
+            self.assertEqual(response.status_code, 200)
+            #the response itself lists the groups of the requested user
+            requester_groups = f'"auth_user_groups"."user_id" = {self.user2.pk}'
+            return len([query for query in queries.captured_queries if requester_groups in query['sql']])
+
+        #users/pk/ checks the role in get_queryset and in the permission
+        self.assertEqual(group_queries(reverse('user-details', kwargs={'pk':self.user3.pk})), 1)
+        #the default cache isn't shared by workers, nor the token cache, roles are read again
+        self.assertEqual(settings.ROLES_CACHE_TIMEOUT, 0)
+        self.assertEqual(group_queries(reverse('user-details', kwargs={'pk':self.user3.pk})), 1)
+        with override_settings(AUTH_TOKEN_CACHE_ALIAS='default'):
+            group_queries(reverse('user-details', kwargs={'pk':self.user3.pk}))
+            self.assertNotIn('_role_names', token_cache.get(self.token2.key)[0].__dict__)
+        #a shared default cache keeps them across requests
+        with override_settings(ROLES_CACHE_TIMEOUT=60):
+            group_queries(reverse('user-details', kwargs={'pk':self.user3.pk}))
+            self.assertEqual(group_queries(reverse('user-details', kwargs={'pk':self.user3.pk})), 0)
+
+        #changing the groups of a user invalidates the cached roles
+        response = self.client.patch(
+            reverse('user-details', kwargs={'pk':self.user2.pk}),
+            {"groups":["Normal_User"]}, format="json",
+            HTTP_AUTHORIZATION=f'Token {self.token1.key}'
+        )
+        self.assertEqual(response.status_code, 200)
+        with override_settings(ROLES_CACHE_TIMEOUT=60):
+            self.assertEqual(get_roles(get_user_model().objects.get(pk=self.user2.pk)), {"Normal_User"})
+        response = self.client.get(
+            reverse('user-details', kwargs={'pk':self.user3.pk}),
+            HTTP_AUTHORIZATION=f'Token {self.token2.key}'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_cached_token_authentication(self):
+        def token_queries(token):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION = f'token {token.key}')
+            return response.status_code, len([query for query in queries.captured_queries if 'authtoken_token' in query['sql']])
+
+        token_cache.clear()
+        #without a shared cache, another worker couldn't tell the token changed
+        self.assertIsNone(settings.AUTH_TOKEN_CACHE_ALIAS)
+        self.assertEqual(token_queries(self.token3), (200, 1))
+        self.assertEqual(token_queries(self.token3), (200, 1))
+
+        with override_settings(AUTH_TOKEN_CACHE_ALIAS='default'):
+            self.assertEqual(token_queries(self.token3), (200, 1))
+            self.assertEqual(token_queries(self.token3), (200, 0))
+            self.assertEqual(token_cache.stats()["hit_rate"], 0.5)
+
+            #deactivating the user takes effect immediately
+            self.user3.is_active = False
+            self.user3.save()
+            self.assertEqual(token_queries(self.token3), (401, 1))
+
+            #so does deleting a token
+            self.assertEqual(token_queries(self.token1), (200, 1))
+            self.token1.delete()
+            self.assertEqual(token_queries(self.token1), (401, 1))
+
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS='default')
+    def test_cached_token_authentication_shared(self):
+        token_cache.clear()
+        response = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION = f'token {self.token3.key}')
+        self.assertEqual(response.status_code, 200)
+        #another worker finds the token in the shared cache
+        token_cache.local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(token_cache.get(self.token3.key)[0], self.user3)
+        #and notices invalidations made elsewhere
+        token_cache.invalidate_user(self.user3.pk)
+        self.assertIsNone(token_cache.get(self.token3.key))
+        #deleted tokens included, though still in this worker's LRU
+        response = self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION = f'token {self.token3.key}')
+        entry = token_cache.local.get(self.token3.key)
+        self.token3.delete()
+        token_cache.local.set(self.token3.key, entry)
+        self.assertIsNone(token_cache.get(self.token3.key))
+
+
+    def test_keyset_pagination(self):
+        FoodItem.objects.bulk_create(
+            FoodItem(user=self.user3, food_item=f'Item {i}', num_of_calories=10) for i in range(7)
+        )
+        FoodItem.objects.create(user=self.user3, food_item='Soup', num_of_calories=10)
+        expected = list(FoodItem.objects.filter(user=self.user3, food_item__startswith='Item').order_by('-timestamp', '-id').values_list('id', flat=True))
+
+        seen = []
+        url = f"{reverse('fooditem')}?like(item,Item*)&pagination=keyset&limit=3"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_AUTHORIZATION = f'token {self.token3.key}')
+            self.assertEqual(response.status_code, 200, f'Expected Response Code 200, received {response.status_code} instead.')
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries.captured_queries))
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(
+            f"{reverse('users')}?pagination=keyset&limit=2",
+            HTTP_AUTHORIZATION = f'token {self.token1.key}'
+        )
+        self.assertEqual([user['id'] for user in response.data['results']], [self.user1.pk, self.user2.pk])
+        response = self.client.get(response.data['next'], HTTP_AUTHORIZATION = f'token {self.token1.key}')
+        self.assertEqual([user['id'] for user in response.data['results']], [self.user3.pk])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(f"{reverse('users')}?cursor=garbage", HTTP_AUTHORIZATION = f'token {self.token1.key}')
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_bulk_create_fooditems(self):
+        FoodItem.objects.create(user=self.user3, food_item="Chicken biryani", num_of_calories=1900)
+        payload = [
+            {"food_item":"Banana"},
+            {"food_item":"Fried rice", "num_of_calories":450},
+            {"food_item":"banana "},
+            {"food_item":"asdasdasd"},
+            "Banana",
+            {"food_item":"", "num_of_calories":10},
+            {"food_item":"Apple pie"},
+        ]
+        response = self.client.post(
+            reverse('fooditem-bulk'),
+            payload, format="json",
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 207, f'Expected Response Code 207, received {response.status_code} instead.')
+        self.assertEqual(response.data["created"], 4)
+        self.assertEqual([result["status"] for result in response.data["results"]], [201, 201, 201, 400, 400, 400, 201])
+        #every distinct food is looked up once
+        self.assertEqual(sorted(StubNutritionixHandler.queries), ["apple pie", "asdasdasd", "banana"])
+        #max_calories of user3 is 2100, crossed by the fried rice
+        self.assertEqual(
+            [result["item"]["calories_exceeded"] for result in response.data["results"] if result["status"] == 201],
+            [False, True, True, True]
+        )
+        self.assertEqual(FoodItem.objects.filter(user=self.user3).count(), 5)
+        total = DailyCalorieTotal.objects.get(user=self.user3, date=timezone.localdate())
+        self.assertEqual((total.total, total.count), (1900 + 105 + 450 + 105 + 296, 5))
+
+        response = self.client.post(
+            reverse('fooditem-bulk'),
+            {"food_item":"Banana"}, format="json",
+            HTTP_AUTHORIZATION = f'token {self.token3.key}'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        #users without a profile have no limit
+        superuser = get_user_model().objects.create(username='root', is_superuser=True)
+        response = self.client.post(
+            reverse('fooditem-bulk'),
+            [{"food_item":"Banana", "num_of_calories":105}, {"food_item":"Rice", "num_of_calories":5000}], format="json",
+            HTTP_AUTHORIZATION = f'token {Token.objects.create(user=superuser).key}'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(DailyCalorieTotal.objects.get(user=superuser).total, 5105)
+        self.assertFalse(FoodItem.objects.filter(user=superuser, calories_exceeded=True).exists())
+
+        #anonymous requests are turned away before anything is looked up
+        StubNutritionixHandler.queries.clear()
+        response = self.client.post(reverse('fooditem-bulk'), [{"food_item":"Mango"}], format="json")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(StubNutritionixHandler.queries, [])
+
+    @override_settings(NUTRITION_ENRICHMENT='deferred')
+    def test_deferred_calorie_enrichment(self):
+        FoodCatalog.objects.create(name="Chicken Biryani", calories=2000)
+        statuses = []
+        for food_item in ("Chicken biryani", "Banana", "asdasdasd"):
+            response = self.client.post(
+                reverse('fooditem'),
+                {"food_item":food_item},
+                HTTP_AUTHORIZATION = f'token {self.token3.key}'
+            )
+            self.assertEqual(response.status_code, 201, f'Expected Response Code 201, received {response.status_code} instead.')
+            statuses.append((response.data["enrichment_status"], response.data["num_of_calories"]))
+        #only foods missing from the catalog and the cache wait for the provider
+        self.assertEqual(statuses, [("done", 2000), ("pending", None), ("pending", None)])
+        self.assertEqual(StubNutritionixHandler.queries, [])
+
+        out = StringIO()
+        call_command('enrich_fooditems', stdout=out)
+        self.assertIn("Enriched 1 food items, 1 not found", out.getvalue())
+        banana = FoodItem.objects.get(user=self.user3, food_item="Banana")
+        self.assertEqual((banana.num_of_calories, banana.enrichment_status), (105, "done"))
+        #the banana takes user3 past 2100 calories
+        self.assertTrue(banana.calories_exceeded)
+        self.assertEqual(FoodItem.objects.get(user=self.user3, food_item="asdasdasd").enrichment_status, "failed")
+        self.assertEqual(DailyCalorieTotal.objects.get(user=self.user3).total, 2105)
+
+        #an item that can't be updated doesn't hold up the others, nor do users without a profile
+        superuser = get_user_model().objects.create(username='root', is_superuser=True)
+        broken = FoodItem.objects.create(user=self.user3, food_item="Chicken burger", enrichment_status="pending")
+        FoodItem.objects.create(user=superuser, food_item="Chicken burger", enrichment_status="pending")
+        apply_calories = enrichment.apply_calories
+
+        def flaky(item, calories):
+            if item.pk == broken.pk:
+                raise DatabaseError("database is locked")
+            return apply_calories(item, calories)
+
+        out = StringIO()
+        with mock.patch('calorie_app.enrichment.apply_calories', flaky):
+            call_command('enrich_fooditems', stdout=out)
+        #the command goes on after enriching something, and tries the broken item again
+        self.assertIn("Enriched 1 food items, 0 not found, 2 lookups failed", out.getvalue())
+        self.assertEqual(FoodItem.objects.get(user=superuser).num_of_calories, 520)
+        broken.refresh_from_db()
+        self.assertEqual((broken.enrichment_status, broken.enrichment_attempts), ("pending", 2))
+
+
+class NutritionProviderTests(TestCase):
+    def setUp(self):
+        lookup_cache.clear()
+
+    @override_settings(NUTRITION_PROVIDER='calorie_app.providers.FakeNutritionProvider',
+                       NUTRITION_PROVIDER_OPTIONS={"foods":{"dosa":168}})
+    def test_fake_provider_from_settings(self):
+        self.assertEqual(lookup_calories("Dosa"), 168)
+        self.assertEqual(lookup_calories("idli"), None)
+        self.assertEqual(get_provider().queries, ["dosa", "idli"])
+
+    def test_retries_and_circuit_breaker(self):
+        provider = NutritionixProvider(retries=2, backoff=0, failure_threshold=2, reset_timeout=60)
+        with mock.patch.object(provider.session, 'get', side_effect=requests.ConnectionError) as get:
+            for _ in range(2):
+                with self.assertRaises(ProviderUnavailable):
+                    provider.lookup("banana")
+            self.assertEqual(get.call_count, 6)
+            self.assertEqual(provider.breaker.state, CircuitBreaker.OPEN)
+            #an open circuit fails fast without touching the network
+            with self.assertRaises(ProviderUnavailable):
+                provider.lookup("banana")
+            self.assertEqual(get.call_count, 6)
+
+    def test_half_open_circuit_closes_on_success(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        #only a single trial call is let through
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial_ends_on_unexpected_errors(self):
+        provider = NutritionixProvider(retries=0, failure_threshold=1, reset_timeout=0)
+        provider.breaker.record_failure()
+        test_cases = [
+            {"name":"sync", "lookup":provider.lookup, "target":provider.session, "error":TypeError},
+        ]
+        #without httpx alookup() runs lookup() on a thread
+        if providers.httpx is not None:
+            test_cases.append({"name":"async", "lookup":async_to_sync(provider.alookup), "target":providers.httpx.AsyncClient, "error":RuntimeError})
+        for i in range(len(test_cases)):
+            with mock.patch.object(test_cases[i]["target"], 'get', side_effect=test_cases[i]["error"]) as get:
+                for _ in range(2):
+                    with self.assertRaises(test_cases[i]["error"]):
+                        test_cases[i]["lookup"]("banana")
+                #the next trial goes through rather than the circuit staying stuck
+                self.assertEqual(get.call_count, 2, test_cases[i]["name"])
+
+    @override_settings(NUTRITIONIX_URL='http://127.0.0.1:1/v2/search/instant')
+    def test_stale_entry_served_when_provider_down(self):
+        lookup_cache.local.set("banana", 105, ttl=-1)
+        self.assertEqual(lookup_calories("Banana"), 105)
+        with self.assertRaises(ProviderUnavailable):
+            lookup_calories("apple")
+
+
+@override_settings(NUTRITION_PROVIDER='calorie_app.providers.FakeNutritionProvider',
+                   NUTRITION_PROVIDER_OPTIONS={"foods":{}})
+class FoodCatalogTests(TestCase):
+    def setUp(self):
+        lookup_cache.clear()
+
+    @staticmethod
+    def write_dataset(suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as dataset:
+            dataset.write(content)
+        return path
+
+    def test_load_food_catalog(self):
+        csv_path = self.write_dataset('.csv', "name,calories\nChicken Biryani,500\nMasala  Dosa,168.4\nbroken,abc\nendless,inf\n")
+        jsonl_path = self.write_dataset('.jsonl', '{"food": "Masala dosa", "kcal": 180}\n{"food": "Paneer Tikka", "kcal": 260}\n')
+        self.addCleanup(os.remove, csv_path)
+        self.addCleanup(os.remove, jsonl_path)
+
+        out = StringIO()
+        call_command('load_food_catalog', csv_path, stdout=out)
+        self.assertIn("Loaded 2 foods into the catalog, skipped 2 records", out.getvalue())
+        self.assertEqual(FoodCatalog.objects.count(), 2)
+        self.assertEqual(FoodCatalog.objects.get(normalized_name="masala dosa").calories, 168)
+
+        #existing foods are kept unless --replace is given
+        call_command('load_food_catalog', jsonl_path, '--name-field', 'food', '--calories-field', 'kcal', stdout=StringIO())
+        self.assertEqual(FoodCatalog.objects.get(normalized_name="masala dosa").calories, 168)
+        self.assertEqual(FoodCatalog.objects.count(), 3)
+        call_command('load_food_catalog', jsonl_path, '--name-field', 'food', '--calories-field', 'kcal', '--replace', stdout=StringIO())
+        self.assertEqual(FoodCatalog.objects.get(normalized_name="masala dosa").calories, 180)
+
+    def test_catalog_lookup(self):
+        FoodCatalog.objects.create(name="Chicken Biryani", calories=500)
+        FoodCatalog.objects.create(name="Banana Bread", calories=196)
+        FoodCatalog.objects.create(name="Banana Cake", calories=320)
+        test_cases = [
+            {"name":"exact", "query":"chicken biryani", "expected":500},
+            {"name":"case_and_spaces", "query":"  CHICKEN   Biryani", "expected":500},
+            {"name":"word_order", "query":"biryani chicken", "expected":500},
+            {"name":"prefix", "query":"banana br", "expected":196},
+            {"name":"ambiguous_prefix", "query":"banana", "expected":None},
+            {"name":"short_prefix", "query":"ban", "expected":None},
+            {"name":"unknown", "query":"paneer", "expected":None},
+        ]
+        for i in range(len(test_cases)):
+            entry = FoodCatalog.objects.lookup(test_cases[i]["query"])
+            self.assertEqual(entry.calories if entry else None, test_cases[i]["expected"], test_cases[i]["name"])
+
+        #exact and word order matches of any number of names take a query each
+        with self.assertNumQueries(2):
+            found = FoodCatalog.objects.lookup_many(["Chicken biryani", "cake banana", "banana bread", "ban"])
+        self.assertEqual({key: entry.calories for key, entry in found.items()},
+                         {"chicken biryani": 500, "cake banana": 320, "banana bread": 196})
+
+    def test_catalog_consulted_before_provider(self):
+        FoodCatalog.objects.create(name="Chicken Biryani", calories=500)
+        self.assertEqual(lookup_calories("Chicken biryani"), 500)
+        self.assertEqual(lookup_calories("Idli"), None)
+        self.assertEqual(get_provider().queries, ["idli"])
+
+
+@override_settings(METRICS_TOKEN='scraper-secret')
+class MetricsTests(StubNutritionixMixin, TestCase):
+    scraper_auth = 'Bearer scraper-secret'
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.clear()
+        user = get_user_model().objects.create(username='metered')
+        UserProfile.objects.create(user=user, max_calories=2000)
+        self.auth = f'token {Token.objects.create(user=user).key}'
+
+    def test_metrics_endpoint(self):
+        self.client.post(reverse('fooditem'), {"food_item":"Banana"}, HTTP_AUTHORIZATION=self.auth)
+        self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=self.auth)
+        metrics = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.scraper_auth).content.decode('utf-8')
+        for line in (
+            'http_requests_total{method="POST",status="201",view="FoodItemView.create"} 1',
+            'http_requests_total{method="GET",status="200",view="FoodItemView.list"} 1',
+            'http_request_duration_seconds_count{view="FoodItemView.list"} 1',
+            'external_call_seconds_count{service="nutritionix"} 1',
+            'nutrition_cache_misses 1',
+        ):
+            self.assertIn(line, metrics)
+        #the POST spent time calling Nutritionix, the GET didn't
+        external = re.findall(r'http_request_external_seconds_sum\{view="(.+?)"\} (.+)', metrics)
+        self.assertGreater(float(dict(external)["FoodItemView.create"]), 0)
+        self.assertEqual(float(dict(external)["FoodItemView.list"]), 0)
+        queries = re.search(r'http_request_db_queries_sum\{view="FoodItemView.list"\} (.+)', metrics)
+        self.assertGreater(float(queries.group(1)), 0)
+
+    def test_async_requests(self):
+        #async views are served by the middleware as a coroutine, their queries run on other threads
+        middleware = MetricsMiddleware(async_fooditem_list)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/fooditem/', HTTP_AUTHORIZATION=self.auth)
+        middleware.process_view(request, async_fooditem_list, (), {})
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 200)
+        metrics = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.scraper_auth).content.decode('utf-8')
+        self.assertIn('http_requests_total{method="GET",status="200",view="fooditem_list"} 1', metrics)
+        queries = re.search(r'http_request_db_queries_sum\{view="fooditem_list"\} (.+)', metrics)
+        self.assertGreater(float(queries.group(1)), 0)
+
+    def test_sampling_and_access(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.client.get(reverse('fooditem'), HTTP_AUTHORIZATION=self.auth)
+        self.assertNotIn('FoodItemView.list', self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.scraper_auth).content.decode('utf-8'))
+        #requests from the local reverse proxy get nothing without the token
+        for auth in ('', 'Bearer wrong', self.auth):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1', HTTP_AUTHORIZATION=auth).status_code, 404, auth)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class FoodItemQueryPlanTests(TestCase):
+    """
+    Fails when one of the hot FoodItem queries stops using an index.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='planner')
+        FoodItem.objects.bulk_create(
+            FoodItem(user=cls.user, food_item=f'item {i}', num_of_calories=i) for i in range(50)
+        )
+
+    def assertUsesIndex(self, queryset, *index_names):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                #tiny test tables would otherwise always be scanned sequentially
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan on calorie_app_fooditem', plan, plan)
+            self.assertTrue(any(re.search(name, plan) for name in index_names), plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertIsNone(re.search(r'SCAN (TABLE )?calorie_app_fooditem\b', plan), plan)
+            self.assertRegex(plan, rf'SEARCH (TABLE )?calorie_app_fooditem USING (COVERING )?INDEX ({"|".join(index_names)})\b')
+        else:
+            self.skipTest(f'No query plan checks for {connection.vendor}')
+
+    def test_user_list(self):
+        #the index Django creates for the user foreign key is just as good here
+        self.assertUsesIndex(FoodItem.objects.filter(user=self.user), 'fooditem_user_ts_idx', 'calorie_app_fooditem_user_id_[0-9a-f]+')
+
+    def test_user_date_filter(self):
+        since = timezone.now() - timezone.timedelta(days=1)
+        self.assertUsesIndex(FoodItem.objects.filter(user=self.user, timestamp__gte=since), 'fooditem_user_ts_idx')
+
+    def test_daily_sum_is_covered(self):
+        queryset = FoodItem.objects.filter(user=self.user, local_date=timezone.localdate()).values_list('num_of_calories')
+        self.assertUsesIndex(queryset, 'fooditem_user_day_idx')
+        if connection.vendor == 'sqlite':
+            self.assertIn('COVERING INDEX', queryset.explain())
+
+    def test_admin_date_filter(self):
+        since = timezone.now() - timezone.timedelta(days=1)
+        self.assertUsesIndex(FoodItem.objects.filter(timestamp__gte=since), 'fooditem_ts_idx')
+
+    def test_item_search(self):
+        _, queryset = FoodFilter(FoodItem.objects.all()).apply_filters('like(item,*item 4*)')
+        self.assertUsesIndex(queryset, 'fooditem_item_idx', 'fooditem_item_trgm')
+
+
+class SQLiteProductionTests(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'production.sqlite3')
+        #the options of the production profile, as settings.py sets them with SQLITE_PRODUCTION=1
+        with mock.patch.dict(os.environ, SQLITE_PRODUCTION='1'):
+            production = importlib.reload(project_settings).DATABASES['default']
+        importlib.reload(project_settings)
+        options = dict(production['OPTIONS'], timeout=0)
+        self.wrapper = type(connections['default'])(dict(connection.settings_dict, NAME=self.path, OPTIONS=options), 'production')
+        self.addCleanup(self.wrapper.close)
+
+    def test_pragmas(self):
+        test_cases = [
+            ("journal_mode", "wal"),
+            ("synchronous", 1),
+            ("cache_size", settings.SQLITE_PRAGMAS['cache_size']),
+            ("temp_store", 2),
+        ]
+        with self.wrapper.cursor() as cursor:
+            for pragma, expected in test_cases:
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], expected, pragma)
+
+    def test_transactions_take_write_lock(self):
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        #readers go on, another writer has to wait
+        other.execute('SELECT 1').fetchone()
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        self.wrapper.connection.rollback()
+        other.execute('BEGIN IMMEDIATE')